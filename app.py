@@ -1,14 +1,19 @@
 import streamlit as st
 import os
 import time
+import asyncio
+import shutil
+import tempfile
 import datetime
+import functools
+import logging
+import logging.handlers
 from dotenv import load_dotenv
-from src.graph import create_graph
-from src.nodes import review_dialogue_node
-from src.model_utils import get_llm
 from src.history import HistoryManager
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.prompts import ChatPromptTemplate
+
+# NOTE: langchain/langgraph (via src.graph, src.nodes, src.model_utils) are
+# imported lazily at the point of use. They add hundreds of ms to module
+# import, and most Streamlit reruns (widget interactions) never need them.
 
 # Safe import for Langfuse decorators
 try:
@@ -23,39 +28,113 @@ except ImportError:
 # Load environment variables
 load_dotenv()
 
-# Configure LangSmith Tracing if enabled in env
-if os.getenv("LANGSMITH_TRACING") == "true":
-    os.environ["LANGSMITH_TRACING"] = "true"
-    # Ensure endpoint is set, default to standard if not
-    if not os.getenv("LANGSMITH_ENDPOINT"):
-        os.environ["LANGSMITH_ENDPOINT"] = "https://api.smith.langchain.com"
-    # Project defaults to "default" if not set, but user might have set it in .env
-    if not os.getenv("LANGSMITH_PROJECT"):
-        os.environ["LANGSMITH_PROJECT"] = "SourceMind"
-
-# Configure Langfuse Tracing if enabled in env
-if os.getenv("LANGFUSE_PUBLIC_KEY") and os.getenv("LANGFUSE_SECRET_KEY"):
-    try:
-        from langfuse.langchain import CallbackHandler
-        st.session_state.langfuse_handler = CallbackHandler()
-    except ImportError:
-        print("Langfuse not installed. Skipping Langfuse configuration.")
-        
+@st.cache_resource
+def _init_tracing():
+    """One-shot LangSmith/Langfuse setup, cached for the process lifetime.
+
+    Streamlit replays this script on every rerun; caching makes the env
+    probing and CallbackHandler construction happen exactly once. Returns
+    the Langfuse handler, or None if tracing isn't configured.
+    """
+    # Configure LangSmith Tracing if enabled in env
+    if os.getenv("LANGSMITH_TRACING") == "true":
+        os.environ["LANGSMITH_TRACING"] = "true"
+        # Ensure endpoint is set, default to standard if not
+        if not os.getenv("LANGSMITH_ENDPOINT"):
+            os.environ["LANGSMITH_ENDPOINT"] = "https://api.smith.langchain.com"
+        # Project defaults to "default" if not set, but user might have set it in .env
+        if not os.getenv("LANGSMITH_PROJECT"):
+            os.environ["LANGSMITH_PROJECT"] = "SourceMind"
+
+    # Configure Langfuse Tracing if enabled in env
+    if os.getenv("LANGFUSE_PUBLIC_KEY") and os.getenv("LANGFUSE_SECRET_KEY"):
+        try:
+            from langfuse.langchain import CallbackHandler
+            return CallbackHandler()
+        except ImportError:
+            print("Langfuse not installed. Skipping Langfuse configuration.")
+    return None
+
+_LANGFUSE_HANDLER = _init_tracing()
+# Keep session_state populated for consumers that look the handler up there
+# (src/model_utils reads st.session_state.langfuse_handler)
+if _LANGFUSE_HANDLER is not None and "langfuse_handler" not in st.session_state:
+    st.session_state.langfuse_handler = _LANGFUSE_HANDLER
+
 st.set_page_config(
     page_title="学术论文分析助手--SourceMind",
     page_icon="📚",
     layout="wide"
 )
 
+# Hot-path warnings go through a memory-buffered logger instead of print():
+# stdout is line-buffered and can block the stream loop on slow terminals.
+# The buffer flushes to stderr when full or on ERROR-level records.
+_logger = logging.getLogger("sourcemind.app")
+if not _logger.handlers:
+    _logger.addHandler(logging.handlers.MemoryHandler(1024, target=logging.StreamHandler()))
+    _logger.setLevel(logging.INFO)
+    _logger.propagate = False
+
+@functools.lru_cache(maxsize=256)
+def _format_duration(seconds):
+    """Format a duration rounded to 0.1s.
+
+    Memoized because status repaints re-format the same durations; callers
+    pass round(seconds, 1) so the cache key space stays small.
+    """
+    return f"{seconds:.1f}秒" if seconds < 60 else f"{seconds/60:.1f}分钟"
+
+def _get_env_cache():
+    """Get the per-session environment variable cache.
+
+    Env vars don't change mid-process, so caching them avoids repeated
+    os.getenv lookups and putenv syscalls on every Streamlit rerun.
+    """
+    if "_env_cache" not in st.session_state:
+        st.session_state._env_cache = {}
+    return st.session_state._env_cache
+
+def _cached_getenv(key, default=""):
+    """Read an env var through the session cache (filled on first access)."""
+    cache = _get_env_cache()
+    if key not in cache:
+        cache[key] = os.environ.get(key, default)
+    return cache[key]
+
+def _set_env(key, value):
+    """Write an env var only when the value actually changed."""
+    cache = _get_env_cache()
+    if cache.get(key) != value:
+        os.environ[key] = value
+        cache[key] = value
+        # model_utils snapshots LLM config; drop its view on changes
+        from src.model_utils import clear_env_cache
+        clear_env_cache()
+
+def _del_env(key):
+    """Remove an env var and its cached value if present."""
+    if key in os.environ:
+        del os.environ[key]
+        from src.model_utils import clear_env_cache
+        clear_env_cache()
+    _get_env_cache().pop(key, None)
+
 def save_uploaded_file(uploaded_file):
-    """Save uploaded file to a temporary directory."""
-    if not os.path.exists("temp"):
-        os.makedirs("temp")
-    
-    file_path = os.path.join("temp", uploaded_file.name)
-    with open(file_path, "wb") as f:
-        f.write(uploaded_file.getbuffer())
-    return file_path
+    """Save uploaded file to a temporary directory.
+
+    Streams the UploadedFile to disk in fixed-size chunks instead of
+    materializing the whole PDF via getbuffer(), keeping peak memory flat
+    for large uploads.
+    """
+    os.makedirs("temp", exist_ok=True)
+
+    # NamedTemporaryFile creates the file atomically; keep the original
+    # filename in the suffix so history/source display stays readable.
+    with tempfile.NamedTemporaryFile(delete=False, dir="temp", suffix=f"_{uploaded_file.name}") as f:
+        uploaded_file.seek(0)
+        shutil.copyfileobj(uploaded_file, f, length=1 << 16)
+        return f.name
 
 def render_model_config_ui(section_title, env_prefix, key_prefix, checkbox_label="启用独立配置"):
     """
@@ -76,9 +155,7 @@ def render_model_config_ui(section_title, env_prefix, key_prefix, checkbox_label
         is_enabled = st.checkbox(checkbox_label, key=f"{key_prefix}_enable", value=False)
         if not is_enabled:
             # Clear provider env var if disabled
-            provider_env_key = f"{env_prefix}LLM_PROVIDER"
-            if provider_env_key in os.environ:
-                del os.environ[provider_env_key]
+            _del_env(f"{env_prefix}LLM_PROVIDER")
             return
 
     provider = st.selectbox(
@@ -87,58 +164,199 @@ def render_model_config_ui(section_title, env_prefix, key_prefix, checkbox_label
         key=f"{key_prefix}_provider"
     )
     
-    os.environ[f"{env_prefix}LLM_PROVIDER"] = provider
+    _set_env(f"{env_prefix}LLM_PROVIDER", provider)
     
     if provider == "OpenAI":
-        api_key = st.text_input("OpenAI API Key", type="password", key=f"{key_prefix}_openai_key", value=os.getenv(f"{env_prefix}OPENAI_API_KEY", ""))
+        api_key = st.text_input("OpenAI API Key", type="password", key=f"{key_prefix}_openai_key", value=_cached_getenv(f"{env_prefix}OPENAI_API_KEY"))
         if api_key:
-            os.environ[f"{env_prefix}OPENAI_API_KEY"] = api_key
+            _set_env(f"{env_prefix}OPENAI_API_KEY", api_key)
         
         model_options = ["gpt-4o", "gpt-4-turbo", "gpt-3.5-turbo", "o1-preview", "o1-mini"]
         selected_model = st.selectbox("选择模型", model_options, index=0, key=f"{key_prefix}_openai_model")
         if selected_model:
-            os.environ[f"{env_prefix}OPENAI_MODEL_NAME"] = selected_model
+            _set_env(f"{env_prefix}OPENAI_MODEL_NAME", selected_model)
             
     elif provider == "Anthropic":
-        api_key = st.text_input("Anthropic API Key", type="password", key=f"{key_prefix}_anthropic_key", value=os.getenv(f"{env_prefix}ANTHROPIC_API_KEY", ""))
+        api_key = st.text_input("Anthropic API Key", type="password", key=f"{key_prefix}_anthropic_key", value=_cached_getenv(f"{env_prefix}ANTHROPIC_API_KEY"))
         if api_key:
-            os.environ[f"{env_prefix}ANTHROPIC_API_KEY"] = api_key
+            _set_env(f"{env_prefix}ANTHROPIC_API_KEY", api_key)
             
         model_options = ["claude-3-5-sonnet-20240620", "claude-3-opus-20240229", "claude-3-sonnet-20240229"]
         selected_model = st.selectbox("选择模型", model_options, index=0, key=f"{key_prefix}_anthropic_model")
         if selected_model:
-            os.environ[f"{env_prefix}ANTHROPIC_MODEL_NAME"] = selected_model
+            _set_env(f"{env_prefix}ANTHROPIC_MODEL_NAME", selected_model)
 
     elif provider == "OpenRouter":
-        api_key = st.text_input("OpenRouter API Key", type="password", key=f"{key_prefix}_openrouter_key", value=os.getenv(f"{env_prefix}OPENROUTER_API_KEY", ""))
+        api_key = st.text_input("OpenRouter API Key", type="password", key=f"{key_prefix}_openrouter_key", value=_cached_getenv(f"{env_prefix}OPENROUTER_API_KEY"))
         if api_key:
-            os.environ[f"{env_prefix}OPENROUTER_API_KEY"] = api_key
+            _set_env(f"{env_prefix}OPENROUTER_API_KEY", api_key)
             # Also set OPENAI_API_KEY as the underlying client uses it
-            os.environ[f"{env_prefix}OPENAI_API_KEY"] = api_key
+            _set_env(f"{env_prefix}OPENAI_API_KEY", api_key)
         
         # OpenRouter base URL is usually https://openrouter.ai/api/v1
-        os.environ[f"{env_prefix}OPENAI_API_BASE"] = "https://openrouter.ai/api/v1"
+        _set_env(f"{env_prefix}OPENAI_API_BASE", "https://openrouter.ai/api/v1")
         
-        model_name = st.text_input("OpenRouter Model Name (例如: google/gemini-pro-1.5)", value=os.getenv(f"{env_prefix}OPENROUTER_MODEL_NAME", "openai/gpt-4o"), key=f"{key_prefix}_openrouter_model")
+        model_name = st.text_input("OpenRouter Model Name (例如: google/gemini-pro-1.5)", value=_cached_getenv(f"{env_prefix}OPENROUTER_MODEL_NAME", "openai/gpt-4o"), key=f"{key_prefix}_openrouter_model")
         if model_name:
-            os.environ[f"{env_prefix}OPENROUTER_MODEL_NAME"] = model_name
+            _set_env(f"{env_prefix}OPENROUTER_MODEL_NAME", model_name)
             # Also set OPENAI_MODEL_NAME as the underlying client uses it
-            os.environ[f"{env_prefix}OPENAI_MODEL_NAME"] = model_name
+            _set_env(f"{env_prefix}OPENAI_MODEL_NAME", model_name)
 
     elif provider == "自定义 (OpenAI 兼容)":
-        api_base = st.text_input("API Base URL", key=f"{key_prefix}_custom_base", value=os.getenv(f"{env_prefix}OPENAI_API_BASE", ""))
-        api_key = st.text_input("API Key", type="password", key=f"{key_prefix}_custom_key", value=os.getenv(f"{env_prefix}OPENAI_API_KEY", ""))
-        model_name = st.text_input("模型名称", key=f"{key_prefix}_custom_model", value=os.getenv(f"{env_prefix}OPENAI_MODEL_NAME", ""))
+        api_base = st.text_input("API Base URL", key=f"{key_prefix}_custom_base", value=_cached_getenv(f"{env_prefix}OPENAI_API_BASE"))
+        api_key = st.text_input("API Key", type="password", key=f"{key_prefix}_custom_key", value=_cached_getenv(f"{env_prefix}OPENAI_API_KEY"))
+        model_name = st.text_input("模型名称", key=f"{key_prefix}_custom_model", value=_cached_getenv(f"{env_prefix}OPENAI_MODEL_NAME"))
         
-        if api_base: os.environ[f"{env_prefix}OPENAI_API_BASE"] = api_base
-        if api_key: os.environ[f"{env_prefix}OPENAI_API_KEY"] = api_key
-        if model_name: os.environ[f"{env_prefix}OPENAI_MODEL_NAME"] = model_name
+        if api_base: _set_env(f"{env_prefix}OPENAI_API_BASE", api_base)
+        if api_key: _set_env(f"{env_prefix}OPENAI_API_KEY", api_key)
+        if model_name: _set_env(f"{env_prefix}OPENAI_MODEL_NAME", model_name)
+
+# Q&A prompt is static: parsed once on first use (lazy so langchain_core
+# isn't pulled in on reruns that never ask a question)
+_QA_PROMPT = None
+
+def _get_qa_prompt():
+    """Parse the QA prompt template on first use and reuse it afterwards."""
+    global _QA_PROMPT
+    if _QA_PROMPT is None:
+        from langchain_core.prompts import ChatPromptTemplate
+        _QA_PROMPT = ChatPromptTemplate.from_template("""
+你是一位精通这篇论文的学术助手。
+请根据以下论文内容，回答用户的提问。
+
+论文内容摘要/片段：
+{doc_content}
+
+用户提问：{question}
+
+回答要求：
+1. 准确、客观，基于论文内容。
+2. 如果论文中没有提到，请明确告知。
+""")
+    return _QA_PROMPT
+
+def _get_qa_llm():
+    """Resolve the configured Q&A client through model_utils' own cache.
+
+    No extra cache layer in front: a (provider, model) key misses config
+    changes like a new API key or base URL for the same model, while the
+    underlying cache already keys on the key digest, base URL and event
+    loop, and reuses connection pools where that is safe.
+    """
+    from src.model_utils import get_llm
+    return get_llm()
+
+# Context budget for Q&A, in tokens (roughly the old 50k-char heuristic)
+_QA_MAX_CONTEXT_TOKENS = 24000
+
+@st.cache_resource
+def _get_qa_encoder():
+    """Cache the tiktoken encoder; building one loads BPE ranks from disk."""
+    import tiktoken
+    try:
+        return tiktoken.encoding_for_model(os.getenv("OPENAI_MODEL_NAME", "gpt-4o"))
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+def _qa_context_slice(doc_content):
+    """Return a token-budgeted prefix of the document for the QA prompt.
+
+    The encoded token list is cached per document, so each question only pays
+    for the slice + decode and the cut never lands mid-token.
+    """
+    try:
+        enc = _get_qa_encoder()
+        doc_key = hash(doc_content)
+        cached = st.session_state.get("_qa_doc_tokens")
+        if cached is None or cached[0] != doc_key:
+            cached = (doc_key, enc.encode(doc_content))
+            st.session_state._qa_doc_tokens = cached
+        tokens = cached[1]
+        if len(tokens) <= _QA_MAX_CONTEXT_TOKENS:
+            return doc_content
+        return enc.decode(tokens[:_QA_MAX_CONTEXT_TOKENS])
+    except Exception:
+        # tiktoken unavailable or the encoding failed: fall back to chars
+        return doc_content[:50000]
+
+def _load_figure_blobs(figures):
+    """Read figure images concurrently and cache the bytes per path.
+
+    Disk reads go through a thread pool so N figures don't serialize on the
+    script thread; reruns hit the session cache and skip the filesystem.
+    """
+    cache = st.session_state.setdefault("_figure_blobs", {})
+    missing = [p for p in figures if p not in cache]
+    if missing:
+        from concurrent.futures import ThreadPoolExecutor
+
+        def read(path):
+            try:
+                with open(path, "rb") as f:
+                    return path, f.read()
+            except OSError as read_err:
+                _logger.warning("Error reading figure %s: %s", path, read_err)
+                return path, None
+
+        with ThreadPoolExecutor() as ex:
+            for path, blob in ex.map(read, missing):
+                cache[path] = blob
+    return [(p, cache[p]) for p in figures if cache.get(p)]
+
+def _render_figures(figures):
+    """Render extracted figures from prefetched in-memory bytes."""
+    st.write(f"共提取到 {len(figures)} 张图表")
+    for path, blob in _load_figure_blobs(figures):
+        st.image(blob, caption=os.path.basename(path))
+
+def _download_bytes(key, text):
+    """Encode a download payload once per content change and reuse the bytes.
+
+    st.download_button re-encodes str payloads to UTF-8 on every rerun;
+    passing cached bytes skips that repeated work and the intermediate copy.
+    """
+    cache = st.session_state.setdefault("_download_bytes", {})
+    text_key = hash(text)
+    cached = cache.get(key)
+    if cached is None or cached[0] != text_key:
+        cached = (text_key, text.encode("utf-8"))
+        cache[key] = cached
+    return cached[1]
+
+def _get_qa_chain():
+    """Return the shared QA chain, rebuilt only when the LLM client changes."""
+    from langchain_core.output_parsers import StrOutputParser
+
+    llm = _get_qa_llm()
+    cached = st.session_state.get("_qa_chain")
+    if cached is None or cached[0] is not llm:
+        chain = _get_qa_prompt() | llm | StrOutputParser()
+        st.session_state._qa_chain = (llm, chain)
+        return chain
+    return cached[1]
+
+@st.cache_resource
+def get_cached_graph():
+    """Build the compiled LangGraph app once per process.
+
+    The graph topology never changes at runtime, so recompiling it on every
+    "开始分析" click is pure overhead; provider/model selection is read from
+    env vars inside the nodes, not baked into the graph.
+    """
+    from src.graph import create_graph
+    return create_graph()
 
 @observe(name="SourceMind Analysis")
-def run_analysis_stream(app, inputs, config=None):
-    """Run the graph stream with observability."""
-    for output in app.stream(inputs, config=config):
-        yield output
+async def run_analysis_stream(app, inputs, config=None):
+    """Run the graph stream asynchronously with observability.
+
+    Using astream_events() keeps provider HTTP calls on the event loop instead
+    of blocking the Streamlit script thread, and surfaces token-level
+    on_chat_model_stream events so tabs can paint partial output while a node
+    is still generating.
+    """
+    async for ev in app.astream_events(inputs, config=config, version="v2"):
+        yield ev
 
 def main():
     st.title("📚 学术论文分析助手--SourceMind")
@@ -177,17 +395,17 @@ def main():
 
         # Web Search Configuration
         with st.expander("网络搜索配置", expanded=True):
-            tavily_key = st.text_input("Tavily API Key (用于搜索相关工作)", type="password", value=os.getenv("TAVILY_API_KEY", ""))
+            tavily_key = st.text_input("Tavily API Key (用于搜索相关工作)", type="password", value=_cached_getenv("TAVILY_API_KEY"))
             if tavily_key:
-                os.environ["TAVILY_API_KEY"] = tavily_key
+                _set_env("TAVILY_API_KEY", tavily_key)
                 
-            exa_key = st.text_input("Exa API Key (可选，增强搜索)", type="password", value=os.getenv("EXA_API_KEY", ""))
+            exa_key = st.text_input("Exa API Key (可选，增强搜索)", type="password", value=_cached_getenv("EXA_API_KEY"))
             if exa_key:
-                os.environ["EXA_API_KEY"] = exa_key
+                _set_env("EXA_API_KEY", exa_key)
                 
-            serp_key = st.text_input("SerpAPI Key (可选，Google 搜索)", type="password", value=os.getenv("SERPAPI_API_KEY", ""))
+            serp_key = st.text_input("SerpAPI Key (可选，Google 搜索)", type="password", value=_cached_getenv("SERPAPI_API_KEY"))
             if serp_key:
-                os.environ["SERPAPI_API_KEY"] = serp_key
+                _set_env("SERPAPI_API_KEY", serp_key)
                 
             if not tavily_key and not exa_key and not serp_key:
                 st.caption("如果没有提供 Key，将跳过网络搜索步骤。")
@@ -221,8 +439,6 @@ def main():
         # VLM parsing is now controlled via the sidebar configuration
         enable_vlm_parsing = st.session_state.get("vlm_enable", False)
 
-        enable_vlm_parsing = st.session_state.get("vlm_enable", False)
-
         if enable_full_translation:
             st.info("已开启全文翻译（含术语一致性优化）")
         else:
@@ -378,29 +594,21 @@ def main():
         # Generate answer
         with st.spinner("思考中..."):
             try:
-                llm = get_llm()
-                # Use a QA prompt that has access to the full document content
-                qa_prompt = ChatPromptTemplate.from_template("""
-                你是一位精通这篇论文的学术助手。
-                请根据以下论文内容，回答用户的提问。
-                
-                论文内容摘要/片段：
-                {doc_content}
-                
-                用户提问：{question}
-                
-                回答要求：
-                1. 准确、客观，基于论文内容。
-                2. 如果论文中没有提到，请明确告知。
-                """)
-                
-                # Limit context size to avoid token limits, though modern models handle large context
-                # Taking first 50k chars is a safe heuristic for now
-                chain = qa_prompt | llm | StrOutputParser()
-                answer = chain.invoke({
-                    "doc_content": doc_content[:50000], 
-                    "question": user_question
-                })
+                # Limit context to a token budget (see _qa_context_slice) so the
+                # cut is model-aware instead of an arbitrary character count.
+                # ainvoke keeps the event loop free during the network wait so
+                # the spinner keeps animating instead of freezing the script.
+                # The chain is resolved inside the coroutine because the LLM
+                # client cache in model_utils keys on the running event loop,
+                # and asyncio.run starts a fresh loop per question.
+                async def _answer():
+                    chain = _get_qa_chain()
+                    return await chain.ainvoke({
+                        "doc_content": _qa_context_slice(doc_content),
+                        "question": user_question
+                    })
+
+                answer = asyncio.run(_answer())
                 
                 st.session_state.qa_history.append({"role": "assistant", "content": answer})
                 
@@ -466,6 +674,11 @@ def main():
         }
 
     # --- Logic when Analysis is Running ---
+    # True only on the script run where streaming just completed; the static
+    # block below then skips repainting content the streaming placeholders
+    # already hold and adds only what streaming didn't (download buttons).
+    just_streamed = False
+
     if st.session_state.analysis_running:
         if not source:
             # Fallback check (should be caught by callback, but safe to keep)
@@ -478,8 +691,8 @@ def main():
 
         else:
             try:
-                # Create graph
-                app = create_graph()
+                # Create graph (cached across reruns; topology is invariant)
+                app = get_cached_graph()
                 
                 # Configure Round Table Streaming Container
                 # This allows nodes.py to write directly to the Round Table tab
@@ -498,6 +711,9 @@ def main():
                 }
                 
                 step_status = {key: 'pending' for key in steps_config}
+                # Parallel analysis steps still awaiting completion; drained
+                # incrementally so the fan-in check below is O(1) per event
+                pending_parallel = {'translate', 'extract_key_points', 'extract_experiments', 'explain_terms', 'related_work_search'}
                 step_timing = {key: {'start': None, 'end': None, 'duration': None} for key in steps_config}
                 step_status['load_paper'] = 'running'
                 step_timing['load_paper']['start'] = time.time()
@@ -505,98 +721,170 @@ def main():
                 current_progress = 0
                 completed_nodes = set()
                 
-                def format_duration(seconds):
-                    return f"{seconds:.1f}秒" if seconds < 60 else f"{seconds/60:.1f}分钟"
+                # Build the 4-column status grid once; each step gets its own
+                # st.empty() placeholder repainted in place when it changes,
+                # instead of rebuilding all widgets per stream event
+                with status_container.container():
+                    cols = st.columns(4) # Grid layout for status
+                    step_placeholders = {
+                        key: cols[idx % 4].empty()
+                        for idx, key in enumerate(steps_config)
+                    }
+
+                rendered_status = {}
+
+                def render_step(key):
+                    """Repaint a single step widget only if its status changed."""
+                    status = step_status[key]
+                    duration = step_timing[key]['duration']
+                    if rendered_status.get(key) == (status, duration):
+                        return
+                    rendered_status[key] = (status, duration)
+                    config = steps_config[key]
+                    if status == 'running':
+                        step_placeholders[key].info(config['running'])
+                    elif status == 'done':
+                        d_text = f" ({_format_duration(round(duration, 1))})" if duration else ""
+                        step_placeholders[key].caption(f"{config['done']}{d_text}")
 
                 def render_logs():
-                    with status_container.container():
-                        # st.info("🚀 分析进度:")
-                        cols = st.columns(4) # Grid layout for status
-                        idx = 0
-                        for key, config in steps_config.items():
-                            status = step_status[key]
-                            with cols[idx % 4]:
-                                if status == 'running':
-                                    st.info(config['running'])
-                                elif status == 'done':
-                                    duration = step_timing[key]['duration']
-                                    d_text = f" ({format_duration(duration)})" if duration else ""
-                                    st.caption(f"{config['done']}{d_text}")
-                            idx += 1
-                
+                    for key in steps_config:
+                        render_step(key)
+
                 render_logs()
                 
                 final_state = {}
                 run_config = {}
-                if "langfuse_handler" in st.session_state:
-                    run_config["callbacks"] = [st.session_state.langfuse_handler]
-
-                # Run stream
-                for output in run_analysis_stream(app, {
-                    "source": source,
-                    "is_full_translation": enable_full_translation,
-                    "use_vlm_parsing": enable_vlm_parsing,
-                    "enable_round_table": enable_round_table
-                }, config=run_config):
-                    for node_name, state_update in output.items():
-                        final_state.update(state_update)
-                        
-                        # Real-time Tab Update with Error Handling
-                        try:
-                            # Identify which tab corresponds to this node update
-                            if "final_report" in state_update:
-                                tab_map["final_report"].markdown(state_update["final_report"])
-                            if "translation" in state_update:
-                                tab_map["translation"].markdown(state_update["translation"])
-                            if "key_points" in state_update:
-                                tab_map["key_points"].markdown(state_update["key_points"])
-                            if "experiments" in state_update:
-                                tab_map["experiments"].markdown(state_update["experiments"])
-                            if "terms" in state_update:
-                                tab_map["terms"].markdown(state_update["terms"])
-                            if "figures" in state_update and state_update["figures"]:
-                                with tab_map["figures"]:
-                                    st.write(f"共提取到 {len(state_update['figures'])} 张图表")
-                                    for img in state_update['figures']:
-                                        st.image(img, caption=os.path.basename(img))
-                            if "related_work_search" in state_update:
-                                tab_map["related_work_search"].markdown(state_update["related_work_search"])
-                        except Exception as update_err:
-                            # Log error but do not crash the main loop
-                            print(f"Error updating tabs: {update_err}")
-                            # Optional: show a small warning in status
-                            st.warning(f"部分结果显示更新失败: {update_err}")
-
-                        # Update Progress logic (same as before)
-                        if node_name in steps_config:
-                            step_status[node_name] = 'done'
-                            end_time = time.time()
-                            step_timing[node_name]['end'] = end_time
-                            if step_timing[node_name]['start']:
-                                step_timing[node_name]['duration'] = end_time - step_timing[node_name]['start']
-                            
-                            if node_name == 'load_paper':
-                                for next_step in ['translate', 'extract_key_points', 'extract_experiments', 'explain_terms', 'related_work_search']:
-                                    step_status[next_step] = 'running'
-                                    step_timing[next_step]['start'] = time.time()
-                            
-                            if node_name not in completed_nodes:
-                                completed_nodes.add(node_name)
-                                current_progress += steps_config[node_name]['weight']
-                                progress_bar.progress(min(current_progress, 95))
-                        
-                        parallel_steps = ['translate', 'extract_key_points', 'extract_experiments', 'explain_terms', 'related_work_search']
-                        if all(step_status[s] == 'done' for s in parallel_steps):
-                            if step_status['generate_report'] != 'running' and step_status['generate_report'] != 'done':
-                                step_status['generate_report'] = 'running'
-                                step_timing['generate_report']['start'] = time.time()
-                        
-                        if step_status['generate_report'] == 'done':
-                             if step_status['review_dialogue'] != 'running' and step_status['review_dialogue'] != 'done':
-                                step_status['review_dialogue'] = 'running'
-                                step_timing['review_dialogue']['start'] = time.time()
-                        
-                        render_logs()
+                if _LANGFUSE_HANDLER is not None:
+                    run_config["callbacks"] = [_LANGFUSE_HANDLER]
+
+                # Map graph nodes to the state key whose text they stream
+                node_to_key = {
+                    "translate": "translation",
+                    "extract_key_points": "key_points",
+                    "extract_experiments": "experiments",
+                    "explain_terms": "terms",
+                    "related_work_search": "related_work_search",
+                    "generate_report": "final_report",
+                }
+
+                # One st.empty() placeholder per text tab so partial output can
+                # be repainted in place instead of appending new elements
+                placeholders = {key: tab_map[key].empty() for key in node_to_key.values()}
+
+                # Per-key chunk accumulators; joining a list of chunks is O(N)
+                # vs O(N^2) for repeated string concatenation
+                accumulators = {key: [] for key in node_to_key.values()}
+                FLUSH_EVERY = 20  # render once per N tokens to bound redraw cost
+                flush_counters = {key: 0 for key in node_to_key.values()}
+
+                def handle_token(node_name, chunk):
+                    """Append a streamed token and repaint its tab periodically."""
+                    key = node_to_key.get(node_name)
+                    if not key:
+                        return
+                    content = getattr(chunk, "content", "") or ""
+                    if isinstance(content, list):
+                        # Anthropic-style content blocks
+                        content = "".join(
+                            part.get("text", "") for part in content if isinstance(part, dict)
+                        )
+                    if not content:
+                        return
+                    accumulators[key].append(content)
+                    flush_counters[key] += 1
+                    if flush_counters[key] % FLUSH_EVERY == 0:
+                        placeholders[key].markdown("".join(accumulators[key]))
+
+                def handle_node_end(node_name, state_update):
+                    """Finalize a node: store its output and update progress."""
+                    nonlocal current_progress
+                    final_state.update(state_update)
+
+                    # Final repaint with the authoritative node output; the
+                    # set intersection visits only keys that have a text tab
+                    try:
+                        for state_key in placeholders.keys() & state_update.keys():
+                            text = state_update[state_key]
+                            if text:
+                                placeholders[state_key].markdown(text)
+                        if "figures" in state_update and state_update["figures"]:
+                            with tab_map["figures"]:
+                                _render_figures(state_update["figures"])
+                    except Exception as update_err:
+                        # Log error but do not crash the main loop
+                        _logger.warning("Error updating tabs: %s", update_err)
+                        # Optional: show a small warning in status
+                        st.warning(f"部分结果显示更新失败: {update_err}")
+
+                    # Update Progress logic; take one timestamp per event and
+                    # reuse it for every timing write in this iteration
+                    now = time.time()
+                    if node_name in steps_config:
+                        step_status[node_name] = 'done'
+                        step_timing[node_name]['end'] = now
+                        if step_timing[node_name]['start']:
+                            step_timing[node_name]['duration'] = now - step_timing[node_name]['start']
+
+                        if node_name == 'load_paper':
+                            for next_step in ['translate', 'extract_key_points', 'extract_experiments', 'explain_terms', 'related_work_search']:
+                                step_status[next_step] = 'running'
+                                step_timing[next_step]['start'] = now
+
+                        if node_name not in completed_nodes:
+                            completed_nodes.add(node_name)
+                            current_progress += steps_config[node_name]['weight']
+                            progress_bar.progress(min(current_progress, 95))
+
+                    # The fused analysis node stands in for four of the
+                    # parallel steps; complete them here so the status grid,
+                    # progress bar and fan-in bookkeeping stay accurate even
+                    # though those nodes never ran. Its state update carries
+                    # the same keys, so the tab repaint above already applied.
+                    if node_name == 'combined_analysis':
+                        for fused in ('translate', 'extract_key_points', 'extract_experiments', 'explain_terms'):
+                            step_status[fused] = 'done'
+                            step_timing[fused]['end'] = now
+                            if step_timing[fused]['start']:
+                                step_timing[fused]['duration'] = now - step_timing[fused]['start']
+                            if fused not in completed_nodes:
+                                completed_nodes.add(fused)
+                                current_progress += steps_config[fused]['weight']
+                            pending_parallel.discard(fused)
+                        progress_bar.progress(min(current_progress, 95))
+
+                    pending_parallel.discard(node_name)
+                    if not pending_parallel:
+                        if step_status['generate_report'] != 'running' and step_status['generate_report'] != 'done':
+                            step_status['generate_report'] = 'running'
+                            step_timing['generate_report']['start'] = now
+
+                    if step_status['generate_report'] == 'done':
+                         if step_status['review_dialogue'] != 'running' and step_status['review_dialogue'] != 'done':
+                            step_status['review_dialogue'] = 'running'
+                            step_timing['review_dialogue']['start'] = now
+
+                    render_logs()
+
+                # Run stream (token events so tabs paint while nodes generate)
+                async def consume_stream():
+                    async for ev in run_analysis_stream(app, {
+                        "source": source,
+                        "is_full_translation": enable_full_translation,
+                        "use_vlm_parsing": enable_vlm_parsing,
+                        "enable_round_table": enable_round_table
+                    }, config=run_config):
+                        kind = ev.get("event")
+                        if kind == "on_chat_model_stream":
+                            node_name = ev.get("metadata", {}).get("langgraph_node")
+                            handle_token(node_name, ev.get("data", {}).get("chunk"))
+                        elif kind == "on_chain_end" and (
+                                ev.get("name") in steps_config or ev.get("name") == "combined_analysis"):
+                            state_update = ev.get("data", {}).get("output") or {}
+                            if isinstance(state_update, dict):
+                                handle_node_end(ev["name"], state_update)
+
+                asyncio.run(consume_stream())
 
                 # Finalize
                 step_status['review_dialogue'] = 'done'
@@ -613,12 +901,14 @@ def main():
                     st.toast(f"✅ 分析结果已自动保存到历史记录 (ID: {record_id[:8]})")
                 except Exception as save_err:
                     st.error(f"⚠️ 自动保存失败: {save_err}")
-                    print(f"Auto-save failed: {save_err}")
+                    _logger.warning("Auto-save failed: %s", save_err)
 
-                # Store result
+                # Store result and fall through to the static-display block
+                # below; a st.rerun() here would throw away the populated
+                # widget tree and replay the whole script just to flip state
                 st.session_state.analysis_result = final_state
                 st.session_state.analysis_running = False
-                st.rerun()
+                just_streamed = True
                 
             except Exception as e:
                 st.error(f"发生错误: {str(e)}")
@@ -638,24 +928,27 @@ def main():
         with tab_map["final_report"]:
             report = final_state.get("final_report", "")
             if report:
-                st.markdown(report)
-                st.download_button("下载报告", report, "analysis_report.md", "text/markdown")
-            else:
+                if not just_streamed:
+                    st.markdown(report)
+                st.download_button("下载报告", _download_bytes("final_report", report), "analysis_report.md", "text/markdown")
+            elif not just_streamed:
                 st.info("报告生成失败")
                 
         # Related Work Tab
         with tab_map["related_work_search"]:
             rw_content = final_state.get("related_work_search", "暂无内容或未配置搜索 Key")
-            st.markdown(rw_content)
+            if not just_streamed:
+                st.markdown(rw_content)
             if rw_content and "暂无内容" not in rw_content:
-                st.download_button("下载相关搜索", rw_content, "related_work.md", "text/markdown")
+                st.download_button("下载相关搜索", _download_bytes("related_work_search", rw_content), "related_work.md", "text/markdown")
 
         with tab_map["review_dialogue"]:
             content = final_state.get("review_dialogue", "")
             if content:
-                st.markdown(content)
-                st.download_button("下载讨论记录", content, "review_dialogue.md", "text/markdown")
-            else:
+                if not just_streamed:
+                    st.markdown(content)
+                st.download_button("下载讨论记录", _download_bytes("review_dialogue", content), "review_dialogue.md", "text/markdown")
+            elif not just_streamed:
                 st.info("暂无对话记录")
             
             st.divider()
@@ -683,8 +976,12 @@ def main():
                     state_for_node["enable_round_table"] = True
                     
                     try:
-                        # Run node
-                        update = review_dialogue_node(state_for_node)
+                        # Run node (imported lazily; only needed on this path).
+                        # The node is a coroutine so that it stays on the
+                        # script thread when the graph runs it; here it gets
+                        # its own loop.
+                        from src.nodes import review_dialogue_node
+                        update = asyncio.run(review_dialogue_node(state_for_node))
                         
                         # Only update if still running (not stopped by user)
                         if st.session_state.round_table_running:
@@ -692,12 +989,11 @@ def main():
                             final_state.update(update)
                             st.session_state.analysis_result = final_state
                             st.session_state.round_table_running = False
-                            
-                            # Cleanup
+
+                            # Cleanup; the dialogue was already streamed into
+                            # the tab, so no rerun is needed to show it
                             if "stream_container" in st.session_state:
                                 del st.session_state.stream_container
-                                
-                            st.rerun()
                     except Exception as e:
                         st.error(f"圆桌讨论运行失败: {e}")
                         st.session_state.round_table_running = False
@@ -706,35 +1002,38 @@ def main():
 
         with tab_map["translation"]:
             trans_content = final_state.get("translation", "暂无内容")
-            st.markdown(trans_content)
+            if not just_streamed:
+                st.markdown(trans_content)
             if trans_content and trans_content != "暂无内容":
-                st.download_button("下载论文翻译", trans_content, "translation.md", "text/markdown")
+                st.download_button("下载论文翻译", _download_bytes("translation", trans_content), "translation.md", "text/markdown")
             
         with tab_map["key_points"]:
             kp_content = final_state.get("key_points", "暂无内容")
-            st.markdown(kp_content)
+            if not just_streamed:
+                st.markdown(kp_content)
             if kp_content and kp_content != "暂无内容":
-                st.download_button("下载论文要点", kp_content, "key_points.md", "text/markdown")
+                st.download_button("下载论文要点", _download_bytes("key_points", kp_content), "key_points.md", "text/markdown")
             
         with tab_map["experiments"]:
             exp_content = final_state.get("experiments", "暂无内容")
-            st.markdown(exp_content)
+            if not just_streamed:
+                st.markdown(exp_content)
             if exp_content and exp_content != "暂无内容":
-                st.download_button("下载论文实验", exp_content, "experiments.md", "text/markdown")
+                st.download_button("下载论文实验", _download_bytes("experiments", exp_content), "experiments.md", "text/markdown")
             
         with tab_map["terms"]:
             terms_content = final_state.get("terms", "暂无内容")
-            st.markdown(terms_content)
+            if not just_streamed:
+                st.markdown(terms_content)
             if terms_content and terms_content != "暂无内容":
-                st.download_button("下载专业术语", terms_content, "terms.md", "text/markdown")
+                st.download_button("下载专业术语", _download_bytes("terms", terms_content), "terms.md", "text/markdown")
             
         with tab_map["figures"]:
             figures = final_state.get("figures", [])
             if figures:
-                st.write(f"共提取到 {len(figures)} 张图表")
-                for img in figures:
-                    st.image(img, caption=os.path.basename(img))
-            else:
+                if not just_streamed:
+                    _render_figures(figures)
+            elif not just_streamed:
                 st.info("未提取到图表")
 
         # --- Human Q&A Section ---
@@ -748,9 +1047,24 @@ def main():
             if "qa_history" not in st.session_state:
                 st.session_state.qa_history = []
                 
-            for msg in st.session_state.qa_history:
-                with st.chat_message(msg["role"]):
-                    st.markdown(msg["content"])
+            # Render all but the newest turn as a single markdown block: one
+            # widget instead of O(N) chat bubbles replayed on every rerun.
+            # The joined string is cached and only rebuilt when history grows.
+            qa_history = st.session_state.qa_history
+            if qa_history:
+                if st.session_state.get("_qa_history_md_len") != len(qa_history) - 1:
+                    st.session_state.qa_history_md = "\n\n---\n\n".join(
+                        f"**{'🙋 用户' if m['role'] == 'user' else '🤖 助手'}:**\n\n{m['content']}"
+                        for m in qa_history[:-1]
+                    )
+                    st.session_state._qa_history_md_len = len(qa_history) - 1
+                if st.session_state.qa_history_md:
+                    st.markdown(st.session_state.qa_history_md)
+
+                # Only the newest message keeps its own chat bubble styling
+                latest = qa_history[-1]
+                with st.chat_message(latest["role"]):
+                    st.markdown(latest["content"])
             
             st.text_input("请输入您的问题...", key="human_qa_input", on_change=handle_human_qa)
         else:
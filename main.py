@@ -1,4 +1,5 @@
 import argparse
+import asyncio
 import os
 import sys
 from dotenv import load_dotenv
@@ -25,8 +26,9 @@ def main():
     app = create_graph()
     
     try:
-        # Run the graph
-        final_state = app.invoke({"source": args.source})
+        # Run the graph; ainvoke lets the async fan-out nodes overlap their
+        # LLM network waits instead of executing one after another
+        final_state = asyncio.run(app.ainvoke({"source": args.source}))
         
         report = final_state.get("final_report")
         if report:
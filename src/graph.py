@@ -3,6 +3,8 @@ from langgraph.graph import StateGraph, END
 from src.state import AgentState
 from src.nodes import (
     load_paper_node,
+    combined_analysis_node,
+    use_combined_analysis,
     translate_node,
     extract_key_points_node,
     extract_experiments_node,
@@ -18,6 +20,7 @@ def create_graph():
     
     # Add nodes
     workflow.add_node("load_paper", load_paper_node)
+    workflow.add_node("combined_analysis", combined_analysis_node)
     workflow.add_node("translate", translate_node)
     workflow.add_node("extract_key_points", extract_key_points_node)
     workflow.add_node("extract_experiments", extract_experiments_node)
@@ -30,12 +33,18 @@ def create_graph():
     # Start -> Load
     workflow.set_entry_point("load_paper")
     
-    # Load -> Parallel Analysis Nodes
-    workflow.add_edge("load_paper", "translate")
-    workflow.add_edge("load_paper", "extract_key_points")
-    workflow.add_edge("load_paper", "extract_experiments")
-    workflow.add_edge("load_paper", "explain_terms")
-    workflow.add_edge("load_paper", "related_work_search")
+    # Load -> Analysis. When the four doc-wide analyses can share one
+    # model call (summary translation, doc fits one context, no dedicated
+    # translation LLM), route to the fused node — one prompt prefix
+    # instead of four. Otherwise fan out to the parallel nodes as before.
+    # The related-work search runs alongside either branch.
+    def route_analysis(state: AgentState):
+        if use_combined_analysis(state):
+            return ["combined_analysis", "related_work_search"]
+        return ["translate", "extract_key_points", "extract_experiments",
+                "explain_terms", "related_work_search"]
+
+    workflow.add_conditional_edges("load_paper", route_analysis)
     
     # Analysis Nodes -> Report
     # We need to make sure 'generate_report' waits for all analysis nodes.
@@ -53,6 +62,7 @@ def create_graph():
     # Since LangGraph execution is step-based.
     # Let's try connecting all to generate_report.
     
+    workflow.add_edge("combined_analysis", "generate_report")
     workflow.add_edge("translate", "generate_report")
     workflow.add_edge("extract_key_points", "generate_report")
     workflow.add_edge("extract_experiments", "generate_report")
@@ -1,9 +1,12 @@
 
 import os
 import sqlite3
-import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import orjson
 import uuid
 import shutil
+import zlib
 import datetime
 import logging
 from typing import Dict, Any, List, Optional
@@ -14,6 +17,20 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class HistoryManager:
+    # Connection tuning applied to every connection. journal_mode=WAL is
+    # persisted in the database file, but synchronous/busy_timeout/cache
+    # settings are per-connection, so they are re-asserted cheaply on open.
+    # WAL lets the UI list view read while a save is committing, and
+    # synchronous=NORMAL amortizes the per-commit fsync into checkpoints.
+    _PRAGMAS = (
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        "PRAGMA temp_store=MEMORY",
+        "PRAGMA cache_size=-65536",
+        "PRAGMA mmap_size=268435456",
+        "PRAGMA busy_timeout=5000",
+    )
+
     def __init__(self, db_path: str = "history_data/history.db", data_dir: str = "history_data"):
         """
         Initialize the HistoryManager with SQLite database and storage directory.
@@ -21,18 +38,35 @@ class HistoryManager:
         self.data_dir = data_dir
         self.db_path = db_path
         self.images_dir = os.path.join(self.data_dir, "images")
-        
-        # Ensure directories exist
-        if not os.path.exists(self.data_dir):
-            os.makedirs(self.data_dir)
-        if not os.path.exists(self.images_dir):
-            os.makedirs(self.images_dir)
+        self.states_dir = os.path.join(self.data_dir, "states")
+
+        # Ensure directories exist (exist_ok skips the extra stat per dir)
+        os.makedirs(self.images_dir, exist_ok=True)
+        os.makedirs(self.states_dir, exist_ok=True)
+        self.exports_dir = os.path.join(self.data_dir, "exports")
+        os.makedirs(self.exports_dir, exist_ok=True)
             
+        self._write_lock = threading.Lock()
         self._init_db()
 
+        # One long-lived connection shared by all methods: reopening per call
+        # re-parses the file header and throws away the page cache configured
+        # by the PRAGMAs. WAL allows concurrent reads; writes are serialized
+        # through _write_lock.
+        self._conn = self._connect()
+        self._conn.row_factory = sqlite3.Row  # Return dict-like rows
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a SQLite connection with the tuning PRAGMAs applied."""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        cursor = conn.cursor()
+        for pragma in self._PRAGMAS:
+            cursor.execute(pragma)
+        return conn
+
     def _init_db(self):
         """Create the history table if it doesn't exist."""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         # Create table for history
@@ -48,133 +82,245 @@ class HistoryManager:
             state_json TEXT NOT NULL
         )
         ''')
-        
+
+        # Index backing the list view's ORDER BY timestamp
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_hist_ts ON analysis_history(timestamp DESC)")
+
+        # Expression index turning the prefix-search fast path into an
+        # index range scan instead of a full-table LIKE scan
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_title_nocase ON analysis_history(title COLLATE NOCASE)")
+
+        # FTS5 mirror of the searchable columns. LIKE '%...%' can never use a
+        # B-tree index, so search_history goes through MATCH when available.
+        try:
+            fts_existed = cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name='analysis_fts'"
+            ).fetchone() is not None
+            cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS analysis_fts USING fts5(
+                title, keywords, source_name, summary,
+                content='analysis_history', content_rowid='rowid'
+            )
+            ''')
+            cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS analysis_fts_ai AFTER INSERT ON analysis_history BEGIN
+                INSERT INTO analysis_fts(rowid, title, keywords, source_name, summary)
+                VALUES (new.rowid, new.title, new.keywords, new.source_name, new.summary);
+            END
+            ''')
+            cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS analysis_fts_ad AFTER DELETE ON analysis_history BEGIN
+                INSERT INTO analysis_fts(analysis_fts, rowid, title, keywords, source_name, summary)
+                VALUES ('delete', old.rowid, old.title, old.keywords, old.source_name, old.summary);
+            END
+            ''')
+            if not fts_existed:
+                # Backfill rows inserted before the FTS table existed (a
+                # database from a pre-FTS version): the triggers only cover
+                # writes from here on, and without this, MATCH silently
+                # finds nothing for every pre-existing record. 'rebuild'
+                # repopulates an external-content table from its source.
+                cursor.execute("INSERT INTO analysis_fts(analysis_fts) VALUES('rebuild')")
+            self._fts_enabled = True
+        except sqlite3.OperationalError as e:
+            logger.warning(f"FTS5 unavailable, search falls back to LIKE: {e}")
+            self._fts_enabled = False
+
         conn.commit()
         conn.close()
 
+    @staticmethod
+    def _persist_figure(img_path: str, new_path: str):
+        """Persist one figure image, preferring a zero-copy hardlink.
+
+        os.link is an O(1) metadata operation when temp/ and history_data/
+        sit on the same filesystem (the common case); cross-device targets
+        or pre-existing files fall back to a real copy.
+        """
+        try:
+            os.link(img_path, new_path)
+        except OSError:
+            shutil.copy2(img_path, new_path)
+
+    _INSERT_SQL = '''
+    INSERT INTO analysis_history (id, timestamp, title, source_type, source_name, summary, keywords, state_json)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    '''
+
     def save_analysis(self, state: AgentState) -> str:
         """
         Save the analysis result (AgentState) to local history.
         Returns the unique ID of the saved record.
         """
         try:
-            # Generate unique ID and timestamp
-            record_id = str(uuid.uuid4())
-            timestamp = datetime.datetime.now().isoformat()
-            
-            # Extract metadata
-            metadata = state.get("metadata", {})
-            title = metadata.get("Title") or metadata.get("title") or "Untitled Analysis"
-            source_name = os.path.basename(state.get("source", "Unknown Source"))
-            source_type = "PDF" if source_name.lower().endswith(".pdf") else "Arxiv"
-            
-            # Extract summary (first 200 chars of report or translation)
-            report = state.get("final_report", "")
-            summary = report[:200] + "..." if report else "No summary available."
-            
-            # Handle images: Copy from temp to persistent storage
-            original_figures = state.get("figures", [])
-            new_figures_paths = []
-            
-            if original_figures:
-                record_images_dir = os.path.join(self.images_dir, record_id)
-                if not os.path.exists(record_images_dir):
-                    os.makedirs(record_images_dir)
-                
-                for img_path in original_figures:
-                    if os.path.exists(img_path):
-                        # Copy image
-                        filename = os.path.basename(img_path)
-                        new_path = os.path.join(record_images_dir, filename)
-                        shutil.copy2(img_path, new_path)
-                        new_figures_paths.append(new_path)
-            
-            # Update state with new image paths for persistence
-            # Create a copy to avoid modifying the runtime state in-place if not desired
-            # But here we want to save the persistent paths
-            persistent_state = state.copy()
-            persistent_state["figures"] = new_figures_paths
-            
-            # Serialize state
-            state_json = json.dumps(persistent_state, ensure_ascii=False)
-            
-            # Keywords (placeholder for now, could be extracted from report)
-            keywords = "Analysis, Paper" 
-            
-            # Insert into DB
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-            INSERT INTO analysis_history (id, timestamp, title, source_type, source_name, summary, keywords, state_json)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (record_id, timestamp, title, source_type, source_name, summary, keywords, state_json))
-            
-            conn.commit()
-            conn.close()
-            
+            row = self._prepare_record(state)
+
+            # Insert into DB (shared connection; writes serialized by lock)
+            with self._write_lock:
+                self._conn.execute(self._INSERT_SQL, row)
+                self._conn.commit()
+
+            record_id = row[0]
             logger.info(f"Saved analysis history: {record_id}")
             return record_id
-            
+
         except Exception as e:
             logger.error(f"Failed to save analysis history: {e}")
             raise e
 
-    def get_all_history(self, sort_by: str = "timestamp", order: str = "DESC") -> List[Dict[str, Any]]:
+    def save_analyses_bulk(self, states: List[AgentState]) -> List[str]:
         """
-        Retrieve all history records (metadata only) for list view.
+        Save many analysis results in one transaction.
+        Batching the inserts pays the commit fsync once instead of per record.
+        Returns the IDs of the saved records.
         """
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row # Return dict-like rows
-        cursor = conn.cursor()
+        rows = [self._prepare_record(state) for state in states]
+        with self._write_lock, self._conn:
+            self._conn.executemany(self._INSERT_SQL, rows)
+        record_ids = [row[0] for row in rows]
+        logger.info(f"Saved {len(record_ids)} analysis history records")
+        return record_ids
+
+    def _prepare_record(self, state: AgentState) -> tuple:
+        """Persist a state's figures and side file; return its DB row tuple."""
+        # Generate unique ID and timestamp
+        record_id = str(uuid.uuid4())
+        timestamp = datetime.datetime.now().isoformat()
         
-        query = f"SELECT id, timestamp, title, source_type, source_name, summary, keywords FROM analysis_history ORDER BY {sort_by} {order}"
-        cursor.execute(query)
+        # Extract metadata
+        metadata = state.get("metadata", {})
+        title = metadata.get("Title") or metadata.get("title") or "Untitled Analysis"
+        source_name = os.path.basename(state.get("source", "Unknown Source"))
+        source_type = "PDF" if source_name.lower().endswith(".pdf") else "Arxiv"
         
-        rows = cursor.fetchall()
-        conn.close()
+        # Extract summary (first 200 chars of report or translation)
+        report = state.get("final_report", "")
+        summary = report[:200] + "..." if report else "No summary available."
+        
+        # Handle images: Copy from temp to persistent storage
+        original_figures = state.get("figures", [])
+        new_figures_paths = []
         
+        if original_figures:
+            record_images_dir = os.path.join(self.images_dir, record_id)
+            os.makedirs(record_images_dir, exist_ok=True)
+
+            to_persist = []
+            for img_path in original_figures:
+                if os.path.exists(img_path):
+                    new_path = os.path.join(record_images_dir, os.path.basename(img_path))
+                    to_persist.append((img_path, new_path))
+                    new_figures_paths.append(new_path)
+
+            # Persist before the DB write below so the transaction stays
+            # short; hardlinks are near-instant and real copies overlap
+            # on the thread pool (shutil.copy2 releases the GIL)
+            if to_persist:
+                with ThreadPoolExecutor(max_workers=8) as ex:
+                    list(ex.map(lambda args: self._persist_figure(*args), to_persist))
+        
+        # Serialize state to a compressed side file instead of inlining
+        # the multi-hundred-KB JSON into the row: SQLite overflows large
+        # TEXT values onto extra pages, which hurts every list/search
+        # scan. The row stores the file path; get_analysis_by_id still
+        # reads legacy inline-JSON rows. orjson emits bytes, which feeds
+        # zlib directly with no intermediate str/encode round-trip; the
+        # dict-merge swaps in the persistent figure paths without mutating
+        # the runtime state or materializing a full shallow copy first.
+        state_path = os.path.join(self.states_dir, f"{record_id}.json.zlib")
+        with open(state_path, "wb") as f:
+            f.write(zlib.compress(orjson.dumps({**state, "figures": new_figures_paths}), 6))
+
+        # Keywords (placeholder for now, could be extracted from report)
+        keywords = "Analysis, Paper"
+
+        return (record_id, timestamp, title, source_type, source_name, summary, keywords, state_path)
+
+    _ALLOWED_SORT = frozenset({"timestamp", "title", "source_type", "source_name"})
+    _ALLOWED_ORDER = frozenset({"ASC", "DESC"})
+
+    def get_all_history(self, sort_by: str = "timestamp", order: str = "DESC") -> List[Dict[str, Any]]:
+        """
+        Retrieve all history records (metadata only) for list view.
+        sort_by/order fall back to timestamp DESC if not in the whitelist,
+        so only known tokens ever reach the SQL string.
+        """
+        if sort_by not in self._ALLOWED_SORT:
+            sort_by = "timestamp"
+        order = order.upper()
+        if order not in self._ALLOWED_ORDER:
+            order = "DESC"
+        query = f"SELECT id, timestamp, title, source_type, source_name, summary, keywords FROM analysis_history ORDER BY {sort_by} {order}"
+        rows = self._conn.execute(query).fetchall()
         return [dict(row) for row in rows]
 
-    def search_history(self, query: str) -> List[Dict[str, Any]]:
+    def search_history(self, query: str, prefix_only: bool = False) -> List[Dict[str, Any]]:
         """
         Search history by title, keywords, or source name.
+        Uses the FTS5 index (prefix match) when available; falls back to LIKE scans.
+        With prefix_only=True, matches only title prefixes case-insensitively
+        via the idx_title_nocase index (a range scan, not a table scan).
         """
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
+        if prefix_only:
+            sql = '''
+            SELECT id, timestamp, title, source_type, source_name, summary, keywords
+            FROM analysis_history
+            WHERE title LIKE ? COLLATE NOCASE
+            ORDER BY timestamp DESC
+            '''
+            rows = self._conn.execute(sql, (f"{query}%",)).fetchall()
+            return [dict(row) for row in rows]
+
+        if self._fts_enabled:
+            # Quote the user input so FTS operators in it are literal; the
+            # trailing * keeps the LIKE-era substring feel for word prefixes.
+            match_expr = '"' + query.replace('"', '""') + '"*'
+            sql = '''
+            SELECT id, timestamp, title, source_type, source_name, summary, keywords
+            FROM analysis_history
+            WHERE rowid IN (SELECT rowid FROM analysis_fts WHERE analysis_fts MATCH ?)
+            ORDER BY timestamp DESC
+            '''
+            try:
+                rows = self._conn.execute(sql, (match_expr,)).fetchall()
+                if rows:
+                    return [dict(row) for row in rows]
+                # Empty MATCH is not authoritative: unicode61 tokenizes a
+                # contiguous CJK run as one token, so a Chinese substring
+                # (the common query here) or a mid-word English fragment
+                # can MATCH nothing even though the text contains it.
+                # Fall through to the LIKE scan for those.
+            except sqlite3.OperationalError as e:
+                logger.warning(f"FTS search failed ({e}), falling back to LIKE")
+
         search_term = f"%{query}%"
         sql = '''
-        SELECT id, timestamp, title, source_type, source_name, summary, keywords 
-        FROM analysis_history 
-        WHERE title LIKE ? OR keywords LIKE ? OR source_name LIKE ?
+        SELECT id, timestamp, title, source_type, source_name, summary, keywords
+        FROM analysis_history
+        WHERE title LIKE ? OR keywords LIKE ? OR source_name LIKE ? OR summary LIKE ?
         ORDER BY timestamp DESC
         '''
-        cursor.execute(sql, (search_term, search_term, search_term))
-        
-        rows = cursor.fetchall()
-        conn.close()
-        
+        rows = self._conn.execute(sql, (search_term,) * 4).fetchall()
         return [dict(row) for row in rows]
 
     def get_analysis_by_id(self, record_id: str) -> Optional[AgentState]:
         """
         Retrieve the full analysis state by ID.
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT state_json FROM analysis_history WHERE id = ?", (record_id,))
-        row = cursor.fetchone()
-        conn.close()
-        
+        row = self._conn.execute(
+            "SELECT state_json FROM analysis_history WHERE id = ?", (record_id,)
+        ).fetchone()
+
         if row:
             try:
-                state = json.loads(row[0])
-                return state
-            except json.JSONDecodeError:
-                logger.error(f"Failed to decode JSON for record {record_id}")
+                value = row[0]
+                if value.lstrip().startswith("{"):
+                    # Legacy record with the JSON stored inline
+                    return orjson.loads(value)
+                with open(value, "rb") as f:
+                    return orjson.loads(zlib.decompress(f.read()))
+            except (orjson.JSONDecodeError, OSError, zlib.error) as e:
+                logger.error(f"Failed to load state for record {record_id}: {e}")
                 return None
         return None
 
@@ -183,24 +329,27 @@ class HistoryManager:
         Delete a history record and its associated files.
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Check if exists
-            cursor.execute("SELECT id FROM analysis_history WHERE id = ?", (record_id,))
-            if not cursor.fetchone():
-                conn.close()
-                return False
-            
-            # Delete from DB
-            cursor.execute("DELETE FROM analysis_history WHERE id = ?", (record_id,))
-            conn.commit()
-            conn.close()
+            with self._write_lock:
+                # Check if exists
+                exists = self._conn.execute(
+                    "SELECT id FROM analysis_history WHERE id = ?", (record_id,)
+                ).fetchone()
+                if not exists:
+                    return False
+
+                # Delete from DB
+                self._conn.execute("DELETE FROM analysis_history WHERE id = ?", (record_id,))
+                self._conn.commit()
             
             # Delete images directory
             record_images_dir = os.path.join(self.images_dir, record_id)
             if os.path.exists(record_images_dir):
                 shutil.rmtree(record_images_dir)
+
+            # Delete the out-of-row state file (absent for legacy records)
+            state_path = os.path.join(self.states_dir, f"{record_id}.json.zlib")
+            if os.path.exists(state_path):
+                os.remove(state_path)
                 
             logger.info(f"Deleted analysis history: {record_id}")
             return True
@@ -218,17 +367,15 @@ class HistoryManager:
         if not state:
             raise ValueError("Record not found")
             
-        export_dir = os.path.join(self.data_dir, "exports")
-        if not os.path.exists(export_dir):
-            os.makedirs(export_dir)
-            
+        export_dir = self.exports_dir  # Created once in __init__
+
         timestamp_str = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"export_{record_id}_{timestamp_str}.{format}"
         file_path = os.path.join(export_dir, filename)
         
         if format == "json":
-            with open(file_path, "w", encoding="utf-8") as f:
-                json.dump(state, f, ensure_ascii=False, indent=2)
+            with open(file_path, "wb") as f:
+                f.write(orjson.dumps(state, option=orjson.OPT_INDENT_2))
         elif format == "md":
             # Combine all markdown content
             content = f"# {state.get('metadata', {}).get('Title', 'Analysis Report')}\n\n"
@@ -1,108 +1,307 @@
 import os
+import atexit
+import asyncio
 import requests
+import shutil
 import tempfile
 import base64
+import hashlib
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
 from typing import List, Tuple, Optional
 import fitz # pymupdf
 import pymupdf4llm # New high-quality extractor
-from langchain_community.document_loaders import ArxivLoader, PyPDFLoader
+from langchain_community.document_loaders import PyPDFLoader
 from langchain_core.documents import Document
 from langchain_core.output_parsers import StrOutputParser
 
-from src.prompts import VLM_PARSING_PROMPT
+from src.prompts import vlm_parsing_messages
 from src.model_utils import get_llm, get_vlm_llm
 
-def download_arxiv_pdf(arxiv_id: str) -> str:
-    """Download Arxiv PDF to a temp file."""
+def download_arxiv_pdf(arxiv_id: str, dest_dir: Optional[str] = None) -> str:
+    """Download Arxiv PDF to `dest_dir` (or a standalone temp file).
+
+    Streams the response straight to disk in 1 MiB chunks so the PDF is
+    never fully buffered in memory and the write overlaps the download.
+    """
     # Construct PDF URL
     pdf_url = f"https://arxiv.org/pdf/{arxiv_id}.pdf"
-    
-    response = requests.get(pdf_url)
-    if response.status_code != 200:
-        raise ValueError(f"Failed to download PDF from {pdf_url}, status code: {response.status_code}")
-    
-    # Create temp file
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as f:
-        f.write(response.content)
-        return f.name
-
-def extract_images_from_pdf(pdf_path: str, output_dir: str = "temp/figures") -> List[str]:
-    """Extract images from a PDF file and save them to output_dir."""
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-        
+
+    with requests.get(pdf_url, stream=True, timeout=30) as response:
+        if response.status_code != 200:
+            raise ValueError(f"Failed to download PDF from {pdf_url}, status code: {response.status_code}")
+
+        if dest_dir:
+            pdf_path = os.path.join(dest_dir, f"{arxiv_id}.pdf")
+            with open(pdf_path, "wb") as f:
+                shutil.copyfileobj(response.raw, f, length=1024 * 1024)
+            return pdf_path
+
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as f:
+            shutil.copyfileobj(response.raw, f, length=1024 * 1024)
+            return f.name
+
+# Parsed-markdown cache keyed by PDF content hash: re-running analysis on
+# the same paper (retries, parameter tweaks) skips the expensive parse.
+_PARSE_CACHE_DIR = os.path.join("temp", "parse_cache")
+
+def _pdf_digest(pdf_path: str) -> str:
+    """Content hash of a PDF file, streamed so large files stay off-heap."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(pdf_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _read_parse_cache(digest: str, ext: str) -> Optional[str]:
+    cache_path = os.path.join(_PARSE_CACHE_DIR, f"{digest}.{ext}")
+    if os.path.exists(cache_path):
+        with open(cache_path, "r", encoding="utf-8") as f:
+            return f.read()
+    return None
+
+def _write_parse_cache(digest: str, ext: str, content: str):
+    os.makedirs(_PARSE_CACHE_DIR, exist_ok=True)
+    cache_path = os.path.join(_PARSE_CACHE_DIR, f"{digest}.{ext}")
+    # Write-then-rename so a crashed run never leaves a truncated cache entry
+    tmp_path = f"{cache_path}.tmp{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp_path, cache_path)
+
+def _to_markdown_cached(pdf_path: str) -> str:
+    """pymupdf4llm.to_markdown with a disk cache keyed by PDF content hash."""
+    digest = _pdf_digest(pdf_path)
+    cached = _read_parse_cache(digest, "md")
+    if cached is not None:
+        print(f"Using cached markdown for {pdf_path}")
+        return cached
+    text = pymupdf4llm.to_markdown(pdf_path)
+    if text:
+        _write_parse_cache(digest, "md", text)
+    return text
+
+def _fetch_arxiv_metadata(arxiv_id: str) -> dict:
+    """Fetch paper metadata from the arxiv.org Atom API.
+
+    The API returns a few KB of XML, versus ArxivLoader which re-downloads
+    the whole PDF just to surface the same fields.
+    """
+    ns = {"atom": "http://www.w3.org/2005/Atom",
+          "arxiv": "http://arxiv.org/schemas/atom"}
+
+    response = requests.get(
+        "http://export.arxiv.org/api/query", params={"id_list": arxiv_id}, timeout=15
+    )
+    response.raise_for_status()
+
+    root = ET.fromstring(response.content)
+    entry = root.find("atom:entry", ns)
+    if entry is None:
+        raise ValueError(f"No Arxiv entry found for id {arxiv_id}")
+
+    def text(tag):
+        el = entry.find(tag, ns)
+        return el.text.strip() if el is not None and el.text else ""
+
+    metadata = {
+        "entry_id": text("atom:id"),
+        "Title": text("atom:title").replace("\n", " "),
+        "Authors": ", ".join(
+            a.findtext("atom:name", default="", namespaces=ns)
+            for a in entry.findall("atom:author", ns)
+        ),
+        "Summary": text("atom:summary"),
+        "Published": text("atom:published"),
+        "primary_category": "",
+        "categories": [c.get("term") for c in entry.findall("atom:category", ns)],
+    }
+    primary = entry.find("arxiv:primary_category", ns)
+    if primary is not None:
+        metadata["primary_category"] = primary.get("term", "")
+    return metadata
+
+# Skip images smaller than 100x100 px (icons, bullets, logos)
+_MIN_IMAGE_PIXELS = 100 * 100
+
+def _extract_images_by_xref(pdf_path: str, jobs: List[Tuple[int, int, int]],
+                            output_dir: str) -> List[str]:
+    """Extract and save a batch of (page_index, image_index, xref) jobs.
+
+    Runs in a worker process, so it opens its own document handle
+    (fitz documents are not pickleable).
+    """
     image_paths = []
-    
+    with fitz.open(pdf_path) as doc:
+        for page_index, image_index, xref in jobs:
+            base_image = doc.extract_image(xref)
+            image_bytes = base_image["image"]
+            image_ext = base_image["ext"]
+
+            image_filename = f"page{page_index+1}_img{image_index+1}.{image_ext}"
+            image_path = os.path.join(output_dir, image_filename)
+
+            with open(image_path, "wb") as f:
+                f.write(image_bytes)
+
+            image_paths.append(image_path)
+    return image_paths
+
+def extract_images_from_pdf(pdf_path: str, output_dir: str = "temp/figures",
+                            doc: Optional[fitz.Document] = None) -> List[str]:
+    """Extract images from a PDF file and save them to output_dir.
+
+    Candidate images are enumerated up-front from get_images metadata:
+    each xref is extracted once even when it recurs on many pages (running
+    headers/logos), and sub-100x100 images are filtered on width/height
+    before paying for stream decoding. The surviving xrefs are decoded in
+    parallel worker processes (PyMuPDF's decoding is CPU-bound under the
+    GIL, so threads would not help); page order is preserved. Pass an
+    already-open `doc` to skip a redundant parse.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    image_paths = []
+    owns_doc = doc is None
+
     try:
-        doc = fitz.open(pdf_path)
-        for page_index, page in enumerate(doc):
-            image_list = page.get_images(full=True)
-            
-            for image_index, img in enumerate(image_list):
-                xref = img[0]
-                base_image = doc.extract_image(xref)
-                image_bytes = base_image["image"]
-                image_ext = base_image["ext"]
-                
-                # Filter small images (likely icons or logos)
-                if len(image_bytes) < 2048: # Skip < 2KB
+        if owns_doc:
+            doc = fitz.open(pdf_path)
+
+        # Enumerate once, deduping repeated xrefs and filtering on the
+        # dimensions reported in the get_images tuple (no decode needed)
+        seen_xrefs = set()
+        jobs = []
+        for page_index in range(len(doc)):
+            for image_index, img in enumerate(doc[page_index].get_images(full=True)):
+                xref, _, width, height = img[0], img[1], img[2], img[3]
+                if xref in seen_xrefs or width * height < _MIN_IMAGE_PIXELS:
                     continue
-                    
-                image_filename = f"page{page_index+1}_img{image_index+1}.{image_ext}"
-                image_path = os.path.join(output_dir, image_filename)
-                
-                with open(image_path, "wb") as f:
-                    f.write(image_bytes)
-                
-                image_paths.append(image_path)
+                seen_xrefs.add(xref)
+                jobs.append((page_index, image_index, xref))
+
+        if not jobs:
+            return image_paths
+
+        max_workers = min(os.cpu_count() or 1, len(jobs))
+        # Contiguous slices keep the flattened result in page order
+        chunk_size = -(-len(jobs) // max_workers)
+        chunks = [jobs[i:i + chunk_size] for i in range(0, len(jobs), chunk_size)]
+        with ProcessPoolExecutor(max_workers=max_workers) as ex:
+            per_chunk = ex.map(_extract_images_by_xref,
+                               [pdf_path] * len(chunks),
+                               chunks,
+                               [output_dir] * len(chunks))
+            for paths in per_chunk:
+                image_paths.extend(paths)
     except Exception as e:
         print(f"Error extracting images: {e}")
-        
+    finally:
+        if owns_doc and doc is not None:
+            doc.close()
+
     return image_paths
 
-def parse_pdf_with_vlm(pdf_path: str) -> str:
+# Bound concurrent VLM requests so a long PDF doesn't trip provider rate limits
+_VLM_MAX_CONCURRENCY = 16
+
+async def _parse_doc_with_vlm(chain, doc):
+    """Pipeline page rendering (CPU) with VLM inference (network).
+
+    A producer renders pages one at a time in a worker thread and feeds a
+    bounded queue; consumer coroutines pull pages and call the VLM, so the
+    first network request goes out while later pages are still rendering.
+    Results keep page order; per-page failures come back as exceptions
+    instead of aborting the whole document.
+    """
+    loop = asyncio.get_running_loop()
+    total_pages = len(doc)
+    results: list = [None] * total_pages
+    queue: asyncio.Queue = asyncio.Queue(maxsize=4)
+
+    def render(page_index):
+        # Zoom=2 for better resolution (important for formulas).
+        # JPEG q85 is 5-10x smaller than PNG for scanned page raster and
+        # lossless enough for text/formula transcription; that shrinks both
+        # the base64 step and the upload payload per page.
+        pix = doc[page_index].get_pixmap(matrix=fitz.Matrix(2, 2))
+        return base64.b64encode(pix.tobytes("jpeg", jpg_quality=85)).decode("utf-8")
+
+    async def producer():
+        for i in range(total_pages):
+            b64 = await loop.run_in_executor(None, render, i)
+            await queue.put((i, b64))
+        for _ in range(_VLM_MAX_CONCURRENCY):
+            await queue.put(None)  # One sentinel per consumer
+
+    async def consumer():
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            page_index, b64 = item
+            try:
+                results[page_index] = await chain.ainvoke(vlm_parsing_messages(b64))
+            except Exception as e:
+                results[page_index] = e
+
+    consumers = [consumer() for _ in range(_VLM_MAX_CONCURRENCY)]
+    await asyncio.gather(producer(), *consumers)
+    return results
+
+def parse_pdf_with_vlm(pdf_path: str, doc: Optional[fitz.Document] = None) -> str:
     """
     Parse PDF using VLM (Visual Language Model) page by page.
     This provides the highest quality for formulas and tables.
+
+    Rendering and VLM calls run as a pipeline: the N serial network
+    round-trips were the dominant latency, and overlapping them with the
+    per-page CPU rendering removes the remaining render-then-call stall.
+    Pass an already-open `doc` to avoid re-parsing the xref table.
     """
+    digest = _pdf_digest(pdf_path)
+    cached = _read_parse_cache(digest, "vlm.md")
+    if cached is not None:
+        print(f"Using cached VLM parse for {pdf_path}")
+        return cached
+
     print(f"Starting VLM parsing for {pdf_path}...")
     full_text = []
-    
+    owns_doc = doc is None
+
     try:
-        doc = fitz.open(pdf_path)
+        if owns_doc:
+            doc = fitz.open(pdf_path)
         # Use a configured LLM (must support vision, e.g., GPT-4o, Claude 3.5)
         # We assume get_llm() returns a vision-capable model if VLM mode is enabled.
         # Ideally, we should check or enforce a vision model here.
-        llm = get_vlm_llm() 
-        chain = VLM_PARSING_PROMPT | llm | StrOutputParser()
-        
+        llm = get_vlm_llm()
+        chain = llm | StrOutputParser()
+
         total_pages = len(doc)
         print(f"PDF has {total_pages} pages. Processing...")
-        
-        for page_index, page in enumerate(doc):
-            print(f"Parsing page {page_index + 1}/{total_pages} with VLM...")
-            
-            # Convert page to image (pixmap)
-            # Zoom=2 for better resolution (important for formulas)
-            pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))
-            img_data = pix.tobytes("png")
-            
-            # Encode to base64
-            img_base64 = base64.b64encode(img_data).decode("utf-8")
-            
-            # Call VLM
-            try:
-                page_markdown = chain.invoke({"image_data": img_base64})
-                full_text.append(f"## Page {page_index + 1}\n\n{page_markdown}")
-            except Exception as e:
-                print(f"Error parsing page {page_index + 1}: {e}")
+
+        # Rendering overlaps the VLM calls; page order is preserved
+        results = asyncio.run(_parse_doc_with_vlm(chain, doc))
+
+        for page_index, result in enumerate(results):
+            if isinstance(result, Exception):
+                print(f"Error parsing page {page_index + 1}: {result}")
                 full_text.append(f"## Page {page_index + 1}\n\n[VLM Parsing Error]")
-                
+            else:
+                full_text.append(f"## Page {page_index + 1}\n\n{result}")
+
     except Exception as e:
         print(f"VLM parsing failed: {e}")
         return ""
-        
-    return "\n\n---\n\n".join(full_text)
+    finally:
+        if owns_doc and doc is not None:
+            doc.close()
+
+    result = "\n\n---\n\n".join(full_text)
+    if result:
+        _write_parse_cache(digest, "vlm.md", result)
+    return result
 
 def load_paper(source: str, use_vlm: bool = False) -> Tuple[str, dict, List[str]]:
     """
@@ -119,7 +318,19 @@ def load_paper(source: str, use_vlm: bool = False) -> Tuple[str, dict, List[str]
     local_pdf_path = None
     full_text = ""
     metadata = {}
-    
+    pdf_doc = None  # Single fitz handle reused for metadata/VLM/page count
+
+    # One session dir per load holds the downloaded PDF and extracted
+    # figures, and is removed at interpreter exit — previously each run
+    # leaked a NamedTemporaryFile PDF into /tmp and a figures dir under
+    # temp/. save_analysis hardlinks/copies figures out before cleanup;
+    # the dir lives under the repo-local temp/ rather than the system
+    # temp dir (often tmpfs, a different device) so those hardlinks to
+    # history_data/ can actually succeed instead of hitting EXDEV.
+    os.makedirs("temp", exist_ok=True)
+    session_dir = tempfile.mkdtemp(prefix="srcmind_", dir="temp")
+    atexit.register(shutil.rmtree, session_dir, ignore_errors=True)
+
     if "arxiv.org" in source:
         # Extract arxiv ID if it's a URL
         # Handle cases like:
@@ -133,31 +344,23 @@ def load_paper(source: str, use_vlm: bool = False) -> Tuple[str, dict, List[str]
         print(f"Loading from Arxiv: {query}...")
         try:
             # Step 1: Always download PDF first to ensure we have the file for both PyMuPDF4LLM and image extraction
-            local_pdf_path = download_arxiv_pdf(query)
-            
+            local_pdf_path = download_arxiv_pdf(query, session_dir)
+
             # Step 2: Use PyMuPDF4LLM or VLM for content extraction
             if use_vlm:
                 print(f"Mode: VLM Visual Parsing enabled. Processing {local_pdf_path}...")
                 full_text = parse_pdf_with_vlm(local_pdf_path)
                 if not full_text:
                     print("VLM parsing returned empty. Falling back to PyMuPDF4LLM...")
-                    full_text = pymupdf4llm.to_markdown(local_pdf_path)
+                    full_text = _to_markdown_cached(local_pdf_path)
             else:
                 print(f"Extracting content using PyMuPDF4LLM from {local_pdf_path}...")
-                full_text = pymupdf4llm.to_markdown(local_pdf_path)
+                full_text = _to_markdown_cached(local_pdf_path)
             
-            # Step 3: Get metadata using ArxivLoader (just for metadata)
+            # Step 3: Get metadata from the Arxiv Atom API (a few KB of XML;
+            # ArxivLoader would re-download the full PDF just for this)
             try:
-                # Use a light load just to get metadata if possible, or use the API wrapper directly
-                # For simplicity, we can use ArxivLoader but ignore its text content if we have better one
-                # Or we can just use the metadata from the first page if ArxivLoader fails
-                loader = ArxivLoader(query=query, load_max_docs=1, load_all_available_meta=True)
-                # We load but only take metadata
-                meta_docs = loader.load()
-                if meta_docs:
-                    metadata = meta_docs[0].metadata
-                else:
-                    metadata = {"source": source, "title": f"Arxiv:{query}"}
+                metadata = _fetch_arxiv_metadata(query)
             except Exception as meta_e:
                 print(f"Warning: Failed to fetch Arxiv metadata: {meta_e}")
                 metadata = {"source": source, "title": f"Arxiv:{query}"}
@@ -167,7 +370,7 @@ def load_paper(source: str, use_vlm: bool = False) -> Tuple[str, dict, List[str]
             print(f"Primary loading failed: {e}. Trying legacy fallback...")
             try:
                 if not local_pdf_path:
-                    local_pdf_path = download_arxiv_pdf(query)
+                    local_pdf_path = download_arxiv_pdf(query, session_dir)
                 loader = PyPDFLoader(local_pdf_path)
                 docs = loader.load()
                 full_text = "\n\n".join([doc.page_content for doc in docs])
@@ -182,46 +385,47 @@ def load_paper(source: str, use_vlm: bool = False) -> Tuple[str, dict, List[str]
         print(f"Loading local PDF: {source}...")
         local_pdf_path = source
         
-        # Use PyMuPDF4LLM or VLM for local files too
+        # Use PyMuPDF4LLM or VLM for local files too.
+        # Open the document once: metadata, VLM rendering and the page
+        # count for image extraction all reuse the same handle instead of
+        # re-parsing the xref table per step.
         try:
+            pdf_doc = fitz.open(local_pdf_path)
+
             if use_vlm:
                 print(f"Mode: VLM Visual Parsing enabled. Processing {local_pdf_path}...")
-                full_text = parse_pdf_with_vlm(local_pdf_path)
+                full_text = parse_pdf_with_vlm(local_pdf_path, doc=pdf_doc)
                 if not full_text:
                     print("VLM parsing returned empty. Falling back to PyMuPDF4LLM...")
-                    full_text = pymupdf4llm.to_markdown(local_pdf_path)
+                    full_text = _to_markdown_cached(local_pdf_path)
             else:
                 print(f"Extracting content using PyMuPDF4LLM from {local_pdf_path}...")
-                full_text = pymupdf4llm.to_markdown(local_pdf_path)
-            
-            # Create basic metadata
+                full_text = _to_markdown_cached(local_pdf_path)
+
+            # Create basic metadata, enriched from the open document
             metadata = {"source": source, "title": os.path.basename(source)}
-            
-            # Try to enrich metadata using PyPDFLoader just for consistency if needed, 
-            # but PyMuPDF4LLM doesn't return structured metadata object directly same as LangChain
-            # We can use fitz to get metadata
-            with fitz.open(local_pdf_path) as doc:
-                metadata.update(doc.metadata)
-                
+            metadata.update(pdf_doc.metadata)
+
         except Exception as e:
             print(f"PyMuPDF4LLM failed for local file: {e}. Falling back to PyPDFLoader.")
             loader = PyPDFLoader(source)
             docs = loader.load()
             full_text = "\n\n".join([doc.page_content for doc in docs])
             metadata = docs[0].metadata if docs else {}
-        
+
     if not full_text:
+        if pdf_doc is not None:
+            pdf_doc.close()
         raise ValueError("No content loaded from source.")
-        
+
     # Extract Images if we have a local PDF path
     image_paths = []
     if local_pdf_path:
-        # Create a unique directory for this session/paper to avoid conflicts?
-        # For simplicity, we use a temp dir structure.
-        # Ideally, pass a unique ID.
-        import uuid
-        session_id = str(uuid.uuid4())[:8]
-        output_dir = os.path.join("temp", "figures", session_id)
-        image_paths = extract_images_from_pdf(local_pdf_path, output_dir)
-    
+        # Figures live inside the session dir, so they share its lifecycle
+        output_dir = os.path.join(session_dir, "figures")
+        image_paths = extract_images_from_pdf(local_pdf_path, output_dir, doc=pdf_doc)
+
+    if pdf_doc is not None:
+        pdf_doc.close()
+
     return full_text, metadata, image_paths
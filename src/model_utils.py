@@ -1,201 +1,352 @@
+import asyncio
+import collections
+import functools
+import hashlib
+import inspect
 import os
-import streamlit as st
-from langchain_openai import ChatOpenAI
+import sys
+import threading
 
-def get_llm():
-    """Get LLM instance based on environment configuration."""
-    provider = os.getenv("LLM_PROVIDER", "OpenAI")
-    
-    # Check for Langfuse callback
-    callbacks = []
-    if "langfuse_handler" in st.session_state:
-        callbacks.append(st.session_state.langfuse_handler)
-    
-    if provider == "Anthropic":
+# NOTE: streamlit and the provider SDKs are imported at point of use.
+# langchain_openai transitively pulls openai/httpx/pydantic (hundreds of
+# milliseconds and tens of MB of RSS), which CLI and worker processes that
+# import this module should not pay unless a getter actually runs.
+
+# Bounded LRU of constructed clients. A plain unbounded cache would leak
+# stale clients (each holding sockets) as the user flips provider/model
+# config at runtime; 8 entries comfortably covers the five roles plus a
+# couple of in-flight config experiments.
+_CLIENT_CACHE_MAX = 8
+_client_cache: "collections.OrderedDict" = collections.OrderedDict()
+_client_cache_lock = threading.Lock()
+
+def _close_llm(llm):
+    """Best-effort close of an evicted client's own connection pool.
+
+    OpenAI-compatible clients run on the shared sync/per-loop async
+    pools, which stay open; Anthropic clients own theirs, so free them
+    on eviction.
+    """
+    for attr in ("_client", "_async_client"):
+        sdk = getattr(llm, attr, None)
+        close = getattr(sdk, "close", None)
+        if close is not None:
+            try:
+                res = close()
+                if inspect.isawaitable(res):
+                    res.close()  # Drop the unawaited coroutine quietly
+            except Exception:
+                pass
+
+def _loop_token():
+    """Identity of the running event loop, or None outside one.
+
+    A client's async connection pool is only safe to reuse under the
+    loop it was created for — the app starts a fresh asyncio.run() loop
+    per analysis/question, and keep-alive connections from an earlier
+    loop fail with "Event loop is closed" when resurfaced on the next.
+    Every cache that can hold an async client keys on this token, so
+    reuse stays within one loop and rebuilds across loops.
+    """
+    try:
+        return id(asyncio.get_running_loop())
+    except RuntimeError:
+        return None
+
+def _cached_llm(provider: str, model_name: str, key_id: str, base_url, api_key):
+    """LRU-cached front of _build_llm, keyed on config plus event loop."""
+    loop_token = _loop_token()
+    cache_key = (provider, model_name, key_id, base_url, loop_token)
+    with _client_cache_lock:
+        llm = _client_cache.get(cache_key)
+        if llm is not None:
+            _client_cache.move_to_end(cache_key)
+            return llm
+
+    llm = _build_llm(provider, model_name, key_id, base_url, loop_token, _api_key=api_key)
+
+    with _client_cache_lock:
+        existing = _client_cache.get(cache_key)
+        if existing is not None:
+            return existing  # Lost a race; keep the first instance
+        _client_cache[cache_key] = llm
+        while len(_client_cache) > _CLIENT_CACHE_MAX:
+            _, evicted = _client_cache.popitem(last=False)
+            if evicted.__class__.__name__ == "ChatAnthropic":
+                _close_llm(evicted)
+    return llm
+
+def _get_callbacks():
+    """Collect the Langfuse callback from the session, if configured.
+
+    One .get probe instead of a __contains__ check plus an attribute read;
+    both go through Streamlit's session runtime, not a plain dict.
+    Returns None when tracing is off (letting LangChain skip callback
+    manager setup entirely) and a memoized 1-tuple otherwise, so no
+    container is allocated per getter call.
+    """
+    import streamlit as st
+    handler = st.session_state.get("langfuse_handler")
+    if handler is None:
+        return None
+    cached = getattr(_get_callbacks, "_tuple", None)
+    if cached is None or cached[0] is not handler:
+        _get_callbacks._tuple = cached = (handler,)
+    return cached
+
+def _chat_anthropic():
+    """Return the ChatAnthropic class, importing it once.
+
+    Memoized on a function attribute so repeated calls (and the repeated
+    ImportError path when the package is missing) cost one attribute load
+    instead of re-running the import machinery and exception formatting.
+    """
+    cls = getattr(_chat_anthropic, "_cls", None)
+    if cls is None:
         try:
             from langchain_anthropic import ChatAnthropic
-        except ImportError:
-             raise ImportError(
+        except ImportError as e:
+            raise ImportError(
                 "langchain-anthropic is not installed. "
                 "Please install it using 'pip install langchain-anthropic' or 'uv add langchain-anthropic'"
-            )
-        model_name = os.getenv("ANTHROPIC_MODEL_NAME", "claude-3-5-sonnet-20240620")
-        api_key = os.getenv("ANTHROPIC_API_KEY")
-        return ChatAnthropic(model=model_name, temperature=0, api_key=api_key, callbacks=callbacks)
-        
-    elif provider in ["OpenAI", "OpenRouter", "自定义 (OpenAI 兼容)"]:
-        model_name = os.getenv("OPENAI_MODEL_NAME", "gpt-4o")
-        api_key = os.getenv("OPENAI_API_KEY")
-        base_url = os.getenv("OPENAI_API_BASE")
-        
-        return ChatOpenAI(
-            model=model_name, 
-            temperature=0, 
-            api_key=api_key,
-            base_url=base_url,
-            callbacks=callbacks
-        )
-    
-    else:
-        # Default fallback
-        return ChatOpenAI(model="gpt-4o", temperature=0, callbacks=callbacks)
+            ) from e
+        _chat_anthropic._cls = cls = ChatAnthropic
+    return cls
+
+@functools.lru_cache(maxsize=None)
+def _shared_sync_client(base_url):
+    """One sync httpx client per base URL.
+
+    The OpenAI-compatible roles usually differ only in model, so routing
+    them through a shared pool amortizes TCP/TLS setup across roles and
+    caps total sockets instead of giving every ChatOpenAI its own pool.
+    """
+    import httpx
+    return httpx.Client(limits=httpx.Limits(max_connections=64, max_keepalive_connections=32))
+
+# Async clients can't be cached per base URL alone: see _loop_token.
+# Keyed per (base URL, loop) and bounded so clients of finished loops
+# age out instead of accumulating.
+_ASYNC_CLIENT_CACHE_MAX = 8
+_async_client_cache: "collections.OrderedDict" = collections.OrderedDict()
+
+def _shared_async_client(base_url, loop_token):
+    """One async httpx client per (base URL, event loop)."""
+    import httpx
+    key = (base_url, loop_token)
+    with _client_cache_lock:
+        client = _async_client_cache.get(key)
+        if client is not None:
+            _async_client_cache.move_to_end(key)
+            return client
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=32))
+        _async_client_cache[key] = client
+        while len(_async_client_cache) > _ASYNC_CLIENT_CACHE_MAX:
+            _async_client_cache.popitem(last=False)
+    return client
+
+def _key_id(api_key) -> str:
+    """Short stable digest standing in for the secret in cache keys."""
+    return hashlib.blake2b(api_key.encode() if api_key else b"", digest_size=8).hexdigest()
+
+def _build_llm(provider: str, model_name: str, key_id: str, base_url, loop_token, _api_key=None):
+    """Construct the chat client for a provider config.
+
+    Each ChatOpenAI/ChatAnthropic carries its own httpx client and
+    connection pool, so rebuilding one per Streamlit rerun pays TCP/TLS
+    setup again on every interaction — always reach this through
+    _cached_llm, which reuses the same client across reruns and evicts
+    stale configs. Only the short `key_id` digest of the secret lands in
+    the cache key; the raw `_api_key` is used solely for construction.
+    Callbacks are attached by the caller, outside the cache key.
+    """
+    if provider == "Anthropic":
+        ChatAnthropic = _chat_anthropic()
+        return ChatAnthropic(model=model_name, temperature=0, api_key=_api_key)
+
+    from langchain_openai import ChatOpenAI
+    http_client = _shared_sync_client(base_url)
+    http_async_client = _shared_async_client(base_url, loop_token)
+    return ChatOpenAI(
+        model=model_name,
+        temperature=0,
+        api_key=_api_key,
+        base_url=base_url,
+        http_client=http_client,
+        http_async_client=http_async_client,
+    )
+
+def _install_llm_cache():
+    """Install the process-wide persistent LLM response cache, once.
+
+    LangChain keys its cache on (prompt, model params), so rerunning the
+    pipeline on an unchanged paper — a rerun of the same Streamlit session
+    or a later one — short-circuits the translation/analysis/report calls
+    instead of paying for them again. SQLite-backed so hits survive
+    process restarts. Deferred to first getter use, matching the
+    module's lazy-import policy.
+    """
+    if getattr(_install_llm_cache, "_done", False):
+        return
+    _install_llm_cache._done = True
+    # set_llm_cache lives in langchain_core (a hard dependency of every
+    # provider package); the langchain facade re-export moved between
+    # releases and is absent in the pinned version. Only the SQLiteCache
+    # backend is genuinely optional, and skipping it is reported rather
+    # than swallowed so a missing cache is visible.
+    from langchain_core.globals import set_llm_cache
+    try:
+        from langchain_community.cache import SQLiteCache
+    except ImportError as e:
+        print(f"LLM response cache disabled (langchain-community unavailable): {e}")
+        return
+    set_llm_cache(SQLiteCache(database_path=".llm_cache.db"))
+
+def _with_callbacks(llm, callbacks):
+    """Attach per-session callbacks (a tuple or None) to a cached client."""
+    llm.callbacks = list(callbacks) if callbacks else None
+    return llm
+
+# Provider names that go through the OpenAI-compatible client. Interned
+# so membership tests on env-sourced strings hit the pointer-equality
+# fast path before falling back to a full compare.
+_OPENAI_COMPATIBLE = frozenset(map(sys.intern, ("OpenAI", "OpenRouter", "自定义 (OpenAI 兼容)")))
+
+# Env-var prefix and default Anthropic model per role. The OpenAI-side
+# default is gpt-4o for every role.
+_ROLE_ANTHROPIC_DEFAULTS = {
+    "": "claude-3-5-sonnet-20240620",
+    "TRANSLATION_": "claude-3-sonnet-20240229",
+    "REVIEW_": "claude-3-5-sonnet-20240620",
+    "VLM_": "claude-3-5-sonnet-20240620",
+    "RELATED_WORK_": "claude-3-sonnet-20240229",
+}
+
+# Every env var the factory can read, precomputed from the role table
+_ENV_SUFFIXES = ("LLM_PROVIDER", "ANTHROPIC_MODEL_NAME", "ANTHROPIC_API_KEY",
+                 "OPENAI_MODEL_NAME", "OPENAI_API_KEY", "OPENAI_API_BASE")
+_ALL_ENV_KEYS = tuple(prefix + suffix
+                      for prefix in _ROLE_ANTHROPIC_DEFAULTS
+                      for suffix in _ENV_SUFFIXES)
+
+@functools.lru_cache(maxsize=1)
+def _env_snapshot() -> dict:
+    """Snapshot the LLM config env vars once instead of per-call getenv.
+
+    LLM config is read-mostly: it changes only when the settings UI writes
+    it, and the UI calls clear_env_cache() afterwards.
+    """
+    return {key: os.environ.get(key) for key in _ALL_ENV_KEYS}
+
+@functools.lru_cache(maxsize=1)
+def _any_role_configured() -> bool:
+    """Whether any role-specific provider override is set.
+
+    Most installs configure only the main provider, so every role getter
+    can short-circuit straight to get_llm() without walking its own
+    config keys.
+    """
+    env = _env_snapshot()
+    return any(env[prefix + "LLM_PROVIDER"] not in (None, "", "None")
+               for prefix in _ROLE_ANTHROPIC_DEFAULTS if prefix)
+
+def clear_env_cache():
+    """Invalidate the env snapshots after configuration changes."""
+    _env_snapshot.cache_clear()
+    _any_role_configured.cache_clear()
+    # The search helpers keep their own key snapshot; clear it too, but
+    # without importing the graph module if it isn't loaded yet
+    nodes = sys.modules.get("src.nodes")
+    if nodes is not None:
+        nodes._search_keys.cache_clear()
+
+def _resolve_anthropic(prefix: str, env: dict, callbacks):
+    model_name = env[prefix + "ANTHROPIC_MODEL_NAME"] or _ROLE_ANTHROPIC_DEFAULTS[prefix]
+    api_key = env[prefix + "ANTHROPIC_API_KEY"]
+    return _with_callbacks(
+        _cached_llm("Anthropic", model_name, _key_id(api_key), None, api_key),
+        callbacks)
+
+def _resolve_openai(prefix: str, env: dict, callbacks):
+    model_name = env[prefix + "OPENAI_MODEL_NAME"] or "gpt-4o"
+    api_key = env[prefix + "OPENAI_API_KEY"]
+    base_url = env[prefix + "OPENAI_API_BASE"]
+    return _with_callbacks(
+        _cached_llm("OpenAI", model_name, _key_id(api_key), base_url, api_key),
+        callbacks)
+
+# Provider name -> resolver; one dict lookup replaces the if/elif chain
+_DISPATCH = {"Anthropic": _resolve_anthropic,
+             **{name: _resolve_openai for name in _OPENAI_COMPATIBLE}}
+
+def _make_llm(prefix: str):
+    """Resolve the configured client for a role given its env-var prefix.
+
+    The five public getters were copy-paste variants differing only in
+    prefix and default model; this is the single implementation behind
+    them. Role-specific providers fall back to the main LLM when unset.
+    """
+    _install_llm_cache()
+
+    # Fast path for the common zero-override install: every role getter
+    # resolves to the main LLM without touching its own config keys
+    if prefix and not _any_role_configured():
+        return get_llm()
+
+    env = _env_snapshot()
+    provider = env[prefix + "LLM_PROVIDER"]
+    if not prefix:
+        provider = provider or "OpenAI"
+    callbacks = _get_callbacks()
+
+    # Roles without a dedicated provider fall back to the main LLM
+    if prefix and (not provider or provider == "None"):
+        return get_llm()
+
+    resolver = _DISPATCH.get(provider)
+    if resolver is not None:
+        return resolver(prefix, env, callbacks)
+
+    if prefix:
+        return get_llm()
+    # Default fallback for an unknown main provider
+    return _with_callbacks(
+        _cached_llm("OpenAI", "gpt-4o", _key_id(None), None, None), callbacks)
+
+def get_llm():
+    """Get LLM instance based on environment configuration."""
+    return _make_llm("")
 
 def get_translation_llm():
     """Get LLM instance for translation tasks, potentially using a dedicated configuration."""
-    # Check if a dedicated translation provider is configured
-    provider = os.getenv("TRANSLATION_LLM_PROVIDER")
-    
-    # Check for Langfuse callback
-    callbacks = []
-    if "langfuse_handler" in st.session_state:
-        callbacks.append(st.session_state.langfuse_handler)
-    
-    # If not configured, fallback to the main LLM
-    if not provider or provider == "None":
-        return get_llm()
-        
-    if provider == "Anthropic":
-        try:
-            from langchain_anthropic import ChatAnthropic
-        except ImportError:
-             raise ImportError(
-                "langchain-anthropic is not installed."
-            )
-        model_name = os.getenv("TRANSLATION_ANTHROPIC_MODEL_NAME", "claude-3-sonnet-20240229")
-        api_key = os.getenv("TRANSLATION_ANTHROPIC_API_KEY")
-        return ChatAnthropic(model=model_name, temperature=0, api_key=api_key, callbacks=callbacks)
-        
-    elif provider in ["OpenAI", "OpenRouter", "自定义 (OpenAI 兼容)"]:
-        model_name = os.getenv("TRANSLATION_OPENAI_MODEL_NAME", "gpt-4o")
-        api_key = os.getenv("TRANSLATION_OPENAI_API_KEY")
-        base_url = os.getenv("TRANSLATION_OPENAI_API_BASE")
-        
-        return ChatOpenAI(
-            model=model_name, 
-            temperature=0, 
-            api_key=api_key,
-            base_url=base_url,
-            callbacks=callbacks
-        )
-    
-    return get_llm()
+    return _make_llm("TRANSLATION_")
 
 def get_review_llm():
     """Get LLM instance for dialogue review tasks."""
-    # Check if a dedicated review provider is configured
-    provider = os.getenv("REVIEW_LLM_PROVIDER")
-    
-    # Check for Langfuse callback
-    callbacks = []
-    if "langfuse_handler" in st.session_state:
-        callbacks.append(st.session_state.langfuse_handler)
-    
-    # If not configured, fallback to the main LLM
-    if not provider or provider == "None":
-        return get_llm()
-        
-    if provider == "Anthropic":
-        try:
-            from langchain_anthropic import ChatAnthropic
-        except ImportError:
-             raise ImportError(
-                "langchain-anthropic is not installed."
-            )
-        model_name = os.getenv("REVIEW_ANTHROPIC_MODEL_NAME", "claude-3-5-sonnet-20240620")
-        api_key = os.getenv("REVIEW_ANTHROPIC_API_KEY")
-        return ChatAnthropic(model=model_name, temperature=0, api_key=api_key, callbacks=callbacks)
-        
-    elif provider in ["OpenAI", "OpenRouter", "自定义 (OpenAI 兼容)"]:
-        model_name = os.getenv("REVIEW_OPENAI_MODEL_NAME", "gpt-4o")
-        api_key = os.getenv("REVIEW_OPENAI_API_KEY")
-        base_url = os.getenv("REVIEW_OPENAI_API_BASE")
-        
-        return ChatOpenAI(
-            model=model_name, 
-            temperature=0, 
-            api_key=api_key,
-            base_url=base_url,
-            callbacks=callbacks
-        )
-    
-    return get_llm()
+    return _make_llm("REVIEW_")
 
 def get_vlm_llm():
     """Get LLM instance for VLM (Visual Language Model) tasks."""
-    # Check if a dedicated VLM provider is configured
-    provider = os.getenv("VLM_LLM_PROVIDER")
-    
-    # Check for Langfuse callback
-    callbacks = []
-    if "langfuse_handler" in st.session_state:
-        callbacks.append(st.session_state.langfuse_handler)
-    
-    # If not configured, fallback to the main LLM
-    if not provider or provider == "None":
-        return get_llm()
-        
-    if provider == "Anthropic":
-        try:
-            from langchain_anthropic import ChatAnthropic
-        except ImportError:
-             raise ImportError(
-                "langchain-anthropic is not installed."
-            )
-        model_name = os.getenv("VLM_ANTHROPIC_MODEL_NAME", "claude-3-5-sonnet-20240620")
-        api_key = os.getenv("VLM_ANTHROPIC_API_KEY")
-        return ChatAnthropic(model=model_name, temperature=0, api_key=api_key, callbacks=callbacks)
-        
-    elif provider in ["OpenAI", "OpenRouter", "自定义 (OpenAI 兼容)"]:
-        model_name = os.getenv("VLM_OPENAI_MODEL_NAME", "gpt-4o")
-        api_key = os.getenv("VLM_OPENAI_API_KEY")
-        base_url = os.getenv("VLM_OPENAI_API_BASE")
-        
-        return ChatOpenAI(
-            model=model_name, 
-            temperature=0, 
-            api_key=api_key,
-            base_url=base_url,
-            callbacks=callbacks
-        )
-    
-    return get_llm()
+    return _make_llm("VLM_")
 
 def get_related_work_llm():
     """Get LLM instance for related work processing tasks."""
-    # Check if a dedicated related work provider is configured
-    provider = os.getenv("RELATED_WORK_LLM_PROVIDER")
-    
-    # Check for Langfuse callback
-    callbacks = []
-    if "langfuse_handler" in st.session_state:
-        callbacks.append(st.session_state.langfuse_handler)
-    
-    # If not configured, fallback to the main LLM
-    if not provider or provider == "None":
-        return get_llm()
-        
-    if provider == "Anthropic":
-        try:
-            from langchain_anthropic import ChatAnthropic
-        except ImportError:
-             raise ImportError(
-                "langchain-anthropic is not installed."
-            )
-        model_name = os.getenv("RELATED_WORK_ANTHROPIC_MODEL_NAME", "claude-3-sonnet-20240229")
-        api_key = os.getenv("RELATED_WORK_ANTHROPIC_API_KEY")
-        return ChatAnthropic(model=model_name, temperature=0, api_key=api_key, callbacks=callbacks)
-        
-    elif provider in ["OpenAI", "OpenRouter", "自定义 (OpenAI 兼容)"]:
-        model_name = os.getenv("RELATED_WORK_OPENAI_MODEL_NAME", "gpt-4o")
-        api_key = os.getenv("RELATED_WORK_OPENAI_API_KEY")
-        base_url = os.getenv("RELATED_WORK_OPENAI_API_BASE")
-        
-        return ChatOpenAI(
-            model=model_name, 
-            temperature=0, 
-            api_key=api_key,
-            base_url=base_url,
-            callbacks=callbacks
-        )
-    
-    return get_llm()
+    return _make_llm("RELATED_WORK_")
+
+async def ainvoke_concurrently(calls):
+    """Await several independent LLM invocations at once.
+
+    The clients returned by the getters share an async connection pool,
+    so sequentially awaiting role calls wastes the network overlap:
+
+        translation, review = await ainvoke_concurrently([
+            (get_translation_llm(), translation_prompt),
+            (get_review_llm(), review_prompt),
+        ])
+
+    Each element of `calls` is an (llm_or_chain, input) pair; results come
+    back in the same order.
+    """
+    import asyncio
+    return await asyncio.gather(*(llm.ainvoke(payload) for llm, payload in calls))
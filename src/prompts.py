@@ -1,4 +1,5 @@
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.messages import HumanMessage, SystemMessage
 
 # 1. Translation Prompt
 TRANSLATION_PROMPT = ChatPromptTemplate.from_template(
@@ -39,7 +40,7 @@ FULL_TRANSLATION_PROMPT = ChatPromptTemplate.from_template(
     """你是一位专业的学术论文翻译助手。请将以下论文片段翻译成流畅、准确的中文。
 
 **重要指令：**
-1. **术语一致性**：请严格参考以下术语表进行翻译，确保术语在全文中的统一性。
+1. **术语一致性**：请严格参考以下术语表进行翻译，确保术语在全文中的统一性。术语表为 TSV 格式，每行依次为：英文术语、中文翻译、备注（可选），以制表符分隔。
 {glossary}
 
 2. **翻译风格**：
@@ -118,6 +119,48 @@ TERMS_PROMPT = ChatPromptTemplate.from_template(
 """
 )
 
+# 9. Combined Analysis Prompt (single-call fusion of prompts 1-4)
+# The four doc-wide analyses each ship the same paper text; when they can
+# share one model, one JSON call delivers all four outputs for a quarter
+# of the input tokens.
+COMBINED_ANALYSIS_PROMPT = ChatPromptTemplate.from_template(
+    """你是一位资深的学术研究员兼翻译助手。请阅读以下论文内容，一次性完成四项分析任务，并以 JSON 格式输出。
+
+**四项任务：**
+1. "translation"：将论文内容翻译成流畅、准确的中文，重点翻译摘要(Abstract)、引言(Introduction)和结论(Conclusion)部分的核心内容；内容过长时概括性地翻译核心意思。图表标题 (Figure/Table Captions) 保留英文原文，不要翻译。
+2. "key_points"：以 Markdown 列表提取核心要点，涵盖研究背景与动机、提出的方法或模型、核心贡献、关键公式与解释（如有重要数学公式，请解释其物理/数学含义）。
+3. "experiments"：提取实验相关信息：使用的数据集、对比的基线方法、主要的实验结果数据（尽量列出具体提升数值或关键指标）、实验结论。表头 (Header)、指标名称 (Metrics) 和方法名称 (Method Names) 严禁翻译，保持英文；仅分析和总结文字使用中文。
+4. "terms"：识别 3-5 个最关键的专业术语或缩写，为每个术语提供中文名称（如果有）和适合初学者的通俗解释。
+
+**输出要求：**
+- 输出一个合法的 JSON 对象，仅包含 "translation"、"key_points"、"experiments"、"terms" 四个字符串字段，字段值为 Markdown 文本。
+- 严禁在 JSON 之外输出任何开场白、解释或结束语。
+
+论文内容:
+{text}
+"""
+)
+
+# 16. Partial-Result Consolidation Prompt (map-reduce analysis path)
+# The reduce step used to re-run the map prompt over the concatenated
+# partials, which fed e.g. the translation prompt its own Chinese output.
+# Kept generic: it sees translation summaries as well as key-point,
+# experiment and term lists.
+MERGE_PARTIALS_PROMPT = ChatPromptTemplate.from_template(
+    """以下是对同一篇论文的不同部分分别执行同一项分析任务得到的结果片段（以 --- 分隔）。
+请将它们合并为一份连贯、完整的结果：
+1. 去除重复内容，合并主题相同的条目。
+2. 保留所有不重复的要点、数据和术语，不要遗漏任何片段中的信息。
+3. 保持片段原有的语言和 Markdown 格式。
+4. 直接输出合并后的结果，**严禁添加"以下是合并结果"之类的说明或客套话**。
+
+结果片段:
+{text}
+
+合并后的完整结果:
+"""
+)
+
 # 8. Related Work Summary Prompt
 RELATED_WORK_PROMPT = ChatPromptTemplate.from_template(
     """你是一位严谨的学术情报分析师。请阅读以下关于论文 "{title}" 的网络搜索结果，对其进行深度整理、压缩和提炼。
@@ -153,10 +196,16 @@ RELATED_WORK_PROMPT = ChatPromptTemplate.from_template(
 )
 
 # 9. VLM Parsing Prompt
-VLM_PARSING_PROMPT = ChatPromptTemplate.from_messages([
-    ("system", "You are a specialized academic paper parser. Your goal is to transcribe the provided image of a PDF page into high-quality Markdown."),
-    ("human", [
-        {"type": "text", "text": """Please transcribe this page into Markdown.
+# Built as frozen message objects rather than a ChatPromptTemplate: only
+# the image block varies between pages, so per-page formatting would
+# re-walk the multi-KB instruction text for variable substitution on
+# every call. The system message and text block are constructed once and
+# shared; each call allocates just the small image dict.
+VLM_SYSTEM_MESSAGE = SystemMessage(
+    content="You are a specialized academic paper parser. Your goal is to transcribe the provided image of a PDF page into high-quality Markdown."
+)
+
+_VLM_TEXT_BLOCK = {"type": "text", "text": """Please transcribe this page into Markdown.
 
 **Strict Requirements:**
 1.  **Formulas**: Transcribe all mathematical formulas into standard LaTeX format using `$` for inline and `$$` for block equations. Ensure high accuracy for subscripts, superscripts, and Greek letters.
@@ -169,10 +218,17 @@ VLM_PARSING_PROMPT = ChatPromptTemplate.from_messages([
     -   For figures, insert a placeholder like `[Figure: <caption text>]` but transcribe the caption text accurately.
     -   Ignore headers/footers (page numbers, conference names running at the top/bottom).
 5.  **Output**: Direct Markdown output only. No introductory or concluding remarks.
-"""},
-        {"type": "image_url", "image_url": {"url": "data:image/png;base64,{image_data}"}}
-    ])
-])
+"""}
+
+def vlm_parsing_messages(image_data: str) -> list:
+    """Build the message list for transcribing one rendered PDF page."""
+    return [
+        VLM_SYSTEM_MESSAGE,
+        HumanMessage(content=[
+            _VLM_TEXT_BLOCK,
+            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_data}"}},
+        ]),
+    ]
 # 10. Moderator Agent Prompt
 MODERATOR_PROMPT = ChatPromptTemplate.from_messages([
     ("system", """你是一位客观、冷静且控场能力极强的学术研讨会主持人。
@@ -206,8 +262,29 @@ MODERATOR_PROMPT = ChatPromptTemplate.from_messages([
 ])
 
 # 11. Critic Agent Prompt (Reviewer A)
-CRITIC_PROMPT = ChatPromptTemplate.from_messages([
-    ("system", """你是一位犀利、严谨且批判性极强的学术评审专家（Methodology Critic）。
+# Shared Markdown/LaTeX formatting rule for the dialogue agents. One
+# source of truth so a wording tweak doesn't have to be repeated (and
+# inevitably drift) across five system prompts.
+_FORMAT_RULE = "-   **格式规范**：输出内容必须是标准的 Markdown。公式请使用 LaTeX 格式（`$` 或 `$$`），代码块请使用 ```code```。"
+
+def _dialogue_prompt(system_template, cached=False):
+    """Build a system+human dialogue prompt, optionally cache-annotated.
+
+    The system block — persona plus the report/doc context — is identical
+    across every turn of one round table. With `cached=True` it carries
+    Anthropic's ephemeral cache_control annotation, so turns after the
+    first reuse the server-side prefix KV cache (a fraction of the input
+    cost, faster first token). Only ChatAnthropic understands the
+    annotation; callers pick the variant per provider.
+    """
+    if cached:
+        system = ("system", [{"type": "text", "text": system_template,
+                              "cache_control": {"type": "ephemeral"}}])
+    else:
+        system = ("system", system_template)
+    return ChatPromptTemplate.from_messages([system, ("human", "{input_text}")])
+
+_CRITIC_SYSTEM = """你是一位犀利、严谨且批判性极强的学术评审专家（Methodology Critic）。
 你专注于寻找论文在**理论推导、算法设计、数学公式、实验设置**等方面的漏洞。
 
 **你的目标：**
@@ -220,17 +297,17 @@ CRITIC_PROMPT = ChatPromptTemplate.from_messages([
 -   **专业**：使用专业术语，引用具体的公式或实验图表（如果知道）。
 -   **不留情面**：你的任务是确保学术严谨性，而不是交朋友。
 -   **严禁造假**：**绝对禁止捏造不存在的参考文献或引用**。如果你要引用外部知识，必须是真实存在的著名理论。如果你不确定具体的论文标题或年份，请使用“根据相关领域的通用理论...”等自然语言描述，**严禁编造类似 `[1] Author, Title, Year` 的虚假引用格式**。
--   **格式规范**：输出内容必须是标准的 Markdown。公式请使用 LaTeX 格式（`$` 或 `$$`），代码块请使用 ```code```。
+""" + _FORMAT_RULE + """
 
 **参考资料（研读报告）：**
 {report_content}
-"""),
-    ("human", "{input_text}")
-])
+"""
+
+CRITIC_PROMPT = _dialogue_prompt(_CRITIC_SYSTEM)
+CRITIC_PROMPT_CACHED = _dialogue_prompt(_CRITIC_SYSTEM, cached=True)
 
 # 12. Practitioner Agent Prompt (Reviewer B)
-PRACTITIONER_PROMPT = ChatPromptTemplate.from_messages([
-    ("system", """你是一位务实、关注 ROI 的资深 AI 工程师/架构师（Industry Practitioner）。
+_PRACTITIONER_SYSTEM = """你是一位务实、关注 ROI 的资深 AI 工程师/架构师（Industry Practitioner）。
 你专注于评估这项研究在**实际工业场景**中的落地价值、部署难度和性价比。
 
 **你的目标：**
@@ -243,17 +320,17 @@ PRACTITIONER_PROMPT = ChatPromptTemplate.from_messages([
 -   **以终为始**：一切以“能否上线赚钱/省钱”为标准。
 -   **直率**：如果觉得是“PPT 论文”，请直接表达担忧。
 -   **严禁造假**：**绝对禁止捏造不存在的工业界案例或具体数据**。讨论应基于行业通用标准和经验（如“通常 ResNet50 的推理延迟是...”），而非虚构某个具体公司的内部数据。
--   **格式规范**：输出内容必须是标准的 Markdown。公式请使用 LaTeX 格式（`$` 或 `$$`），代码块请使用 ```code```。
+""" + _FORMAT_RULE + """
 
 **参考资料（研读报告）：**
 {report_content}
-"""),
-    ("human", "{input_text}")
-])
+"""
+
+PRACTITIONER_PROMPT = _dialogue_prompt(_PRACTITIONER_SYSTEM)
+PRACTITIONER_PROMPT_CACHED = _dialogue_prompt(_PRACTITIONER_SYSTEM, cached=True)
 
 # 13. Author Agent Prompt (Updated)
-AUTHOR_PROMPT = ChatPromptTemplate.from_messages([
-    ("system", """你是一位自信、博学且善辩的资深研究员（论文作者）。
+_AUTHOR_SYSTEM = """你是一位自信、博学且善辩的资深研究员（论文作者）。
 你非常熟悉这篇论文的每一个细节（基于提供的全文内容）。
 你正在参加一场高强度的学术圆桌辩论，面对来自方法论专家和应用实践者的尖锐质疑。
 
@@ -267,13 +344,14 @@ AUTHOR_PROMPT = ChatPromptTemplate.from_messages([
 -   **不卑不亢**：面对挑衅保持冷静，用专业性回击。
 -   **逻辑清晰**：回答要条理分明，先说结论，再展证据。
 -   **实事求是**：**严禁编造论文中未提及的实验数据、结论或对比结果**。如果评审员的问题超出了论文范围，请诚实地回答“论文中未涉及此内容”或“这是未来的工作方向”，绝对不能为了反驳而捏造事实。
--   **格式规范**：输出内容必须是标准的 Markdown。公式请使用 LaTeX 格式（`$` 或 `$$`），代码块请使用 ```code```。
+""" + _FORMAT_RULE + """
 
 **背景知识库（论文全文）：**
 {doc_content}
-"""),
-    ("human", "{input_text}")
-])
+"""
+
+AUTHOR_PROMPT = _dialogue_prompt(_AUTHOR_SYSTEM)
+AUTHOR_PROMPT_CACHED = _dialogue_prompt(_AUTHOR_SYSTEM, cached=True)
    # 14. Reader Agent Prompt (For Simple Dialogue Fallback)
 READER_PROMPT = ChatPromptTemplate.from_messages([
     ("system", """你是一位好奇心强、思维活跃的初学者（学生/读者）。
@@ -289,7 +367,7 @@ READER_PROMPT = ChatPromptTemplate.from_messages([
 -   **追问到底**：如果对方回答得太笼统，请追问细节或举例。
 -   **保持真实**：不要装作懂了，不懂就问。表现出真实的求知欲。
 -   **严禁重复**：不要重复对方已经说过的废话。
--   **格式规范**：输出内容必须是标准的 Markdown。公式请使用 LaTeX 格式（`$` 或 `$$`），代码块请使用 ```code```。
+""" + _FORMAT_RULE + """
 
 **当前状态：**
 你已经阅读了报告。
@@ -298,8 +376,7 @@ READER_PROMPT = ChatPromptTemplate.from_messages([
 ])
 
 # 15. Simple Author Agent Prompt (For Simple Dialogue Fallback)
-SIMPLE_AUTHOR_PROMPT = ChatPromptTemplate.from_messages([
-    ("system", """你是一位耐心、博学且严谨的资深研究员（论文作者/导师）。
+_SIMPLE_AUTHOR_SYSTEM = """你是一位耐心、博学且严谨的资深研究员（论文作者/导师）。
 你非常熟悉这篇论文的每一个细节（基于提供的全文内容）。
 你正在与一位初学者（读者）对话，解答他对论文报告的疑问。
 
@@ -313,13 +390,14 @@ SIMPLE_AUTHOR_PROMPT = ChatPromptTemplate.from_messages([
 -   **深入浅出**：避免堆砌术语，多用生活中的例子。
 -   **基于事实**：所有回答必须严格基于论文内容，严禁编造数据。
 -   **引用原文**：如果可能，指明答案在论文的哪一部分（如“正如引言中所述...”）。
--   **格式规范**：输出内容必须是标准的 Markdown。公式请使用 LaTeX 格式（`$` 或 `$$`），代码块请使用 ```code```。
+""" + _FORMAT_RULE + """
 
 **背景知识库（论文全文）：**
 {doc_content}
-"""),
-    ("human", "{input_text}")
-])
+"""
+
+SIMPLE_AUTHOR_PROMPT = _dialogue_prompt(_SIMPLE_AUTHOR_SYSTEM)
+SIMPLE_AUTHOR_PROMPT_CACHED = _dialogue_prompt(_SIMPLE_AUTHOR_SYSTEM, cached=True)
 
 # 5. Final Report Generation Prompt
 REPORT_PROMPT = ChatPromptTemplate.from_template(
@@ -15,3 +15,4 @@ class AgentState(TypedDict):
     figures: Optional[list[str]] # List of paths to extracted figure images
     review_dialogue: Optional[str] # Dialogue between reader and author models
     enable_round_table: Optional[bool] # Toggle for Multi-Agent Round Table Discussion
+    simple_rounds: Optional[int] # Round count for the simple Reader-Author dialogue (default 5)